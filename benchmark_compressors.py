@@ -0,0 +1,132 @@
+import sys
+import json
+import time
+import inspect
+import argparse
+import resource
+import multiprocessing as mp
+
+# PyTorch libraries
+import torch
+
+# My libraries
+from config import load_config
+from grace_fl import compressor_registry
+from grace_fl.packing import pack_bits
+import grace_fl.constant as const
+from utils import format_table
+
+def current_rss():
+    """Resident set size of the process in bytes, or None if it is not available."""
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return None
+
+def max_rss():
+    """Peak resident set size of the process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def payload_bytes(codes):
+    """Bytes allocated by the output of a compressor."""
+    return codes.numel() * codes.element_size()
+
+def synthetic_tensors(size, density, num_clients):
+    """Synthetic gradients of the stacked clients and a packed reference of "+" signs
+    which differ from the signs of the gradients with the given density.
+    """
+    gradients = torch.randn(num_clients, size)
+    flips = torch.rand(num_clients, size) < density
+    positives = (gradients > const.EPSILON) != flips
+    reference = pack_bits(positives)
+
+    return gradients, reference
+
+def run_case(case):
+    """Time the encoder and the decoder of a compressor on one synthetic setting."""
+    torch.manual_seed(case["seed"])
+    config = load_config()
+    config.users = case["clients"]
+    config.sampling_fraction = 1
+    grace = compressor_registry[case["compressor"]](config)
+    grace._current_sign = 1
+
+    with_reference = hasattr(grace, "compress_with_reference")
+    kwargs = {"sign": 1} if "sign" in inspect.signature(grace.compress).parameters else {}
+    ref_kwargs = {"sign": 1} if with_reference and "sign" in inspect.signature(grace.compress_with_reference).parameters else {}
+    gradients, reference = synthetic_tensors(case["size"], case["density"], case["clients"])
+
+    baseline = current_rss()
+    encode_times, decode_times = [], []
+    for _ in range(case["repeats"]):
+        start = time.perf_counter()
+        if with_reference:
+            codes = grace.compress_with_reference(gradients, reference, **ref_kwargs)
+        else:
+            codes = grace.compress(gradients, **kwargs)
+        encode_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        if with_reference:
+            grace.decompress_with_reference(codes, reference, shape=gradients.shape)
+        else:
+            grace.decompress(codes, shape=gradients.shape)
+        decode_times.append(time.perf_counter() - start)
+
+    raw_bytes = gradients.numel() * const.FLOAT_BIT // const.BYTE_BIT
+    result = dict(case)
+    result["encode_MBps"] = raw_bytes / min(encode_times) / 1e6
+    result["decode_MBps"] = raw_bytes / min(decode_times) / 1e6
+    result["raw_bytes"] = raw_bytes
+    result["coded_bytes"] = payload_bytes(codes)
+    result["actual_ratio"] = raw_bytes / result["coded_bytes"]
+    result["compress_ratio"] = float(grace.compress_ratio)
+    result["ideal_ratio"] = float(grace.ideal_compress_ratio) if hasattr(grace, "ideal_compress_ratio") else None
+    result["header_overhead"] = float(grace.header_overhead) if hasattr(grace, "header_overhead") else None
+    result["peak_memory_MB"] = None if baseline is None else max(max_rss() - baseline, 0) / 1e6
+
+    return result
+
+# the columns of the table and their formats
+table_columns = [("compressor", "{:s}"), ("size", "{:d}"), ("density", "{:.3f}"), ("clients", "{:d}"),
+                 ("encode_MBps", "{:.1f}"), ("decode_MBps", "{:.1f}"), ("peak_memory_MB", "{:.1f}"),
+                 ("coded_bytes", "{:d}"), ("actual_ratio", "{:.2f}"), ("compress_ratio", "{:.2f}"),
+                 ("ideal_ratio", "{:.2f}"), ("header_overhead", "{:.3f}")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the encode/decode throughput of the registered compressors.")
+    parser.add_argument("--compressors", nargs="+", default=list(compressor_registry), help="entries of compressor_registry")
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e3, 1e5, 1e6, 1e7, 5e7], help="tensor sizes per client")
+    parser.add_argument("--densities", nargs="+", type=float, default=[0.01, 0.1], help="residual densities")
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 4], help="numbers of stacked clients")
+    parser.add_argument("--repeats", type=int, default=3, help="repeats per setting, the fastest one is reported")
+    parser.add_argument("--json", default="bench_compressors.json", help="path of the machine-readable results")
+    parser.add_argument("--no-isolate", action="store_true", help="run in this process, peak memory is not reported")
+    args = parser.parse_args()
+
+    cases = [dict(compressor=name, size=int(size), density=density, clients=clients, repeats=args.repeats, seed=0)
+             for name in args.compressors for size in args.sizes for density in args.densities for clients in args.clients]
+
+    # every setting runs in a fresh process so that its peak memory is not polluted by the others
+    results = []
+    if args.no_isolate:
+        for case in cases:
+            result = run_case(case)
+            result["peak_memory_MB"] = None
+            results.append(result)
+            print(format_table(results[-1:], table_columns).splitlines()[-1], flush=True)
+    else:
+        context = mp.get_context("spawn")
+        for case in cases:
+            with context.Pool(1) as pool:
+                results.append(pool.apply(run_case, (case,)))
+            print(format_table(results[-1:], table_columns).splitlines()[-1], flush=True)
+
+    print(format_table(results, table_columns))
+    with open(args.json, "w") as fp:
+        json.dump(results, fp, indent=2)
+
+if __name__ == "__main__":
+    main()
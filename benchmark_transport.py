@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import inspect
+import argparse
+import tempfile
+import multiprocessing as mp
+import numpy as np
+
+# PyTorch libraries
+import torch
+
+# My libraries
+from config import load_config
+from grace_fl import compressor_registry
+from utils.transport import send_frame, FrameReceiver, connect, accept, listen
+from utils import format_table
+from benchmark_compressors import synthetic_tensors
+import grace_fl.constant as const
+
+# tags of the benchmark frames: a payload, a payload which the server acknowledges, and the end
+PAYLOAD, ACK, STOP = 0, 1, 2
+
+def serve(address, ready, capacity):
+    """Receive frames into a preallocated buffer and acknowledge the ACK frames with one byte."""
+    listener, address = listen(address)
+    ready.send(address)
+    sock = accept(listener)
+    receiver = FrameReceiver(sock, capacity=capacity)
+    while True:
+        frame = receiver.recv()
+        if frame is None or frame[0] == STOP:
+            break
+        if frame[0] == ACK:
+            sock.sendall(b"\x01")
+
+    sock.close()
+    listener.close()
+
+def compressed_payload(case):
+    """Compress a synthetic gradient with the predictive reference if the compressor has one."""
+    torch.manual_seed(case["seed"])
+    config = load_config()
+    config.users = 1
+    config.sampling_fraction = 1
+    grace = compressor_registry[case["compressor"]](config)
+    grace._current_sign = 1
+
+    gradients, reference = synthetic_tensors(case["size"], case["density"], 1)
+    if hasattr(grace, "compress_with_reference"):
+        kwargs = {"sign": 1} if "sign" in inspect.signature(grace.compress_with_reference).parameters else {}
+        codes = grace.compress_with_reference(gradients, reference, **kwargs)
+    else:
+        kwargs = {"sign": 1} if "sign" in inspect.signature(grace.compress).parameters else {}
+        codes = grace.compress(gradients, **kwargs)
+
+    return codes
+
+def run_case(case, address):
+    """Stream the payload of a compressor to a server process and time the frames."""
+    codes = compressed_payload(case)
+
+    context = mp.get_context("spawn")
+    ready, serverReady = context.Pipe()
+    server = context.Process(target=serve, args=(address, serverReady, 2*codes.numel()*codes.element_size()))
+    server.start()
+    sock = connect(ready.recv())
+    ack = bytearray(1)
+
+    # latency: every frame waits for the acknowledgement of the server
+    latencies = []
+    for _ in range(case["latency_frames"]):
+        start = time.perf_counter()
+        frameBytes = send_frame(sock, [codes], tag=ACK)
+        sock.recv_into(ack)
+        latencies.append(time.perf_counter() - start)
+
+    # throughput: the frames are streamed and the last one is acknowledged once the server has all of them
+    start = time.perf_counter()
+    for _ in range(case["frames"] - 1):
+        send_frame(sock, [codes], tag=PAYLOAD)
+    send_frame(sock, [codes], tag=ACK)
+    sock.recv_into(ack)
+    elapsed = time.perf_counter() - start
+
+    send_frame(sock, [], tag=STOP)
+    sock.close()
+    server.join()
+
+    raw_bytes = case["size"] * const.FLOAT_BIT // const.BYTE_BIT
+    latencies = np.asarray(latencies) * 1e6
+    result = dict(case)
+    result["frame_bytes"] = frameBytes
+    result["frames_per_sec"] = case["frames"] / elapsed
+    result["payload_MBps"] = case["frames"] * frameBytes / elapsed / 1e6
+    result["gradient_MBps"] = case["frames"] * raw_bytes / elapsed / 1e6
+    result["latency_p50_us"] = float(np.percentile(latencies, 50))
+    result["latency_p99_us"] = float(np.percentile(latencies, 99))
+
+    return result
+
+# the columns of the table and their formats
+table_columns = [("compressor", "{:s}"), ("transport", "{:s}"), ("size", "{:d}"), ("density", "{:.3f}"),
+                 ("frame_bytes", "{:d}"), ("frames_per_sec", "{:.1f}"), ("payload_MBps", "{:.1f}"),
+                 ("gradient_MBps", "{:.1f}"), ("latency_p50_us", "{:.1f}"), ("latency_p99_us", "{:.1f}")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the throughput and latency of the compressor payloads over a loopback socket.")
+    parser.add_argument("--compressors", nargs="+", default=list(compressor_registry), help="entries of compressor_registry")
+    parser.add_argument("--sizes", nargs="+", type=float, default=[1e5, 1e6, 1e7], help="gradient sizes per client")
+    parser.add_argument("--densities", nargs="+", type=float, default=[0.01, 0.1], help="residual densities")
+    parser.add_argument("--transports", nargs="+", default=["tcp", "unix"], choices=["tcp", "unix"], help="loopback TCP or Unix sockets")
+    parser.add_argument("--frames", type=int, default=200, help="streamed frames of the throughput measurement")
+    parser.add_argument("--latency-frames", type=int, default=100, help="acknowledged frames of the latency measurement")
+    parser.add_argument("--json", default="bench_transport.json", help="path of the machine-readable results")
+    args = parser.parse_args()
+
+    cases = [dict(compressor=name, transport=transport, size=int(size), density=density,
+                  frames=args.frames, latency_frames=args.latency_frames, seed=0)
+             for name in args.compressors for size in args.sizes for density in args.densities for transport in args.transports]
+
+    results = []
+    with tempfile.TemporaryDirectory() as socketDir:
+        for case in cases:
+            if case["transport"] == "unix":
+                address = os.path.join(socketDir, "server.sock")
+                if os.path.exists(address):
+                    os.remove(address)
+            else:
+                address = ("127.0.0.1", 0)
+            results.append(run_case(case, address))
+            print(format_table(results[-1:], table_columns).splitlines()[-1], flush=True)
+
+    print(format_table(results, table_columns))
+    with open(args.json, "w") as fp:
+        json.dump(results, fp, indent=2)
+
+if __name__ == "__main__":
+    main()
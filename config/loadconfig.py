@@ -1,17 +1,24 @@
 import yaml
 import json
 import os
+import logging
 
-def load_config():
-    """Load configurations of yaml file"""
+def load_config(overrides=None):
+    """Load configurations of yaml file, the items of `overrides` replace the loaded values."""
     current_path = os.path.dirname(__file__)
 
     with open(os.path.join(current_path, "config.yaml"), "r") as fp:
         config = yaml.load(fp, Loader=yaml.FullLoader)
 
+    if overrides is not None:
+        for key in overrides:
+            if key not in config:
+                logging.error("Override '{:s}' is not a configuration in config.yaml.".format(key))
+        config.update(overrides)
+
     # Empty class for yaml loading
     class cfg: pass
-    
+
     for key in config:
         setattr(cfg, key, config[key])
 
@@ -0,0 +1,15 @@
+import argparse
+
+# My libraries
+from deeplearning.mmap_dataset import convert_dataset
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert pickled datasets into memory-mapped .npy stores.")
+    parser.add_argument("src_path", help="the pickled dataset")
+    parser.add_argument("dst_dir", help="the directory to store the converted dataset")
+    args = parser.parse_args()
+
+    convert_dataset(args.src_path, args.dst_dir)
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from .dataset import UserDataset, assign_user_data
+from .dataset import UserDataset, DeviceDataset, assign_user_data
 from .networks import NaiveMLP, NaiveCNN
 
 nn_registry = {
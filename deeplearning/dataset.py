@@ -6,6 +6,9 @@ import logging
 import torch
 from torch.utils.data import Dataset
 
+# My libraries
+from deeplearning.mmap_dataset import load_mmap_dataset
+
 class UserDataset(Dataset):
     def __init__(self, images, labels):
         """Construct a user train_dataset and convert ndarray 
@@ -25,56 +28,222 @@ class UserDataset(Dataset):
         return dict(image=image, label=label)
 
 
+class DeviceDataset(object):
+    def __init__(self, images, labels, device="cuda"):
+        """Hold a whole dataset once on the device, images are kept as uint8 and 
+        normalized to float32 only when a batch is fetched.
+        """
+        images = np.asarray(images)
+        if images.dtype != np.uint8:
+            if not np.array_equal(images, images.astype(np.uint8)):
+                raise ValueError("Images of {:s} are not uint8 pixels and cannot be kept on the device as uint8."
+                                 .format(str(images.dtype)))
+            images = images.astype(np.uint8)
+
+        self.images = torch.from_numpy(np.array(images)).to(device)
+        self.labels = torch.from_numpy(np.array(labels, dtype=np.int64)).to(device)
+        self.device = device
+        self.num_samples = self.labels.shape[0]
+
+    def __len__(self):
+        return self.num_samples
+
+    def fetch(self, sampleIDs):
+        """Fetch a batch of normalized images and labels given an index tensor or a slice."""
+        images = self.images[sampleIDs].to(torch.float32).div_(255)
+        labels = self.labels[sampleIDs]
+        return images, labels
+
+    def loader(self, sampleIDs, batch_size):
+        """Iterate over the given samples in batches of dict(image, label)."""
+        for start in range(0, sampleIDs.shape[0], batch_size):
+            image, label = self.fetch(sampleIDs[start:start+batch_size])
+            yield dict(image=image, label=label)
+
+
+class UserSampler(object):
+    def __init__(self, offsets, sampleIDs, shuffle=False):
+        """Keep the sampleIDs of all users in one flat index array with a wrap-around 
+        cursor per user, so that serving a batch is a slice and a pointer bump.
+
+        Args:
+            offsets (np.ndarray):   the sampleIDs of user u are sampleIDs[offsets[u]:offsets[u+1]].
+            sampleIDs (np.ndarray): the flat sampleIDs of all users.
+            shuffle (bool):         reshuffle the samples of a user whenever its cursor wraps around.
+        """
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.sampleIDs = np.asarray(sampleIDs, dtype=np.int64)
+        self.num_samples = np.diff(self.offsets)
+        self.cursors = np.zeros(self.num_samples.shape[0], dtype=np.int64)
+        self.shuffle = shuffle
+
+    def __getitem__(self, userID):
+        return self.sampleIDs[self.offsets[userID]:self.offsets[userID+1]]
+
+    def next_batch(self, userID, batch_size):
+        """Return the next min(batch_size, num_samples) sampleIDs of a user."""
+        num_samples = self.num_samples[userID]
+        batch_size = min(batch_size, num_samples)
+        start = self.offsets[userID] + self.cursors[userID]
+        end = start + batch_size
+
+        if end <= self.offsets[userID+1]:
+            sampleIDs = self.sampleIDs[start:end].copy()
+        else:
+            sampleIDs = np.concatenate((self.sampleIDs[start:self.offsets[userID+1]],
+                                        self.sampleIDs[self.offsets[userID]:end - num_samples]))
+        
+        self._move_cursors(np.asarray([userID]), batch_size)
+        return sampleIDs
+
+    def next_batches(self, userIDs, batch_size):
+        """Return the next sampleIDs of a cohort of users in one gather. Every user draws the next 
+        min(batch_size, num_samples) of its samples as in `next_batch`, and the rows of the users 
+        with fewer samples are padded with repeated samples.
+
+        Returns:
+            tuple:  sampleIDs of shape [num_users x padded batch size] and the batch size of every user.
+        """
+        userIDs = np.asarray(userIDs)
+        num_samples = self.num_samples[userIDs]
+        batch_sizes = np.minimum(batch_size, num_samples)
+        positions = (self.cursors[userIDs, None] + np.arange(batch_sizes.max())) % np.maximum(num_samples, 1)[:, None]
+
+        # the rows of users without samples point at any sample, their batch size is 0
+        indices = np.minimum(self.offsets[userIDs, None] + positions, self.sampleIDs.shape[0] - 1)
+        sampleIDs = self.sampleIDs[indices]
+
+        self._move_cursors(userIDs, batch_sizes)
+        return sampleIDs, batch_sizes
+
+    def state_dict(self):
+        """The assignment of the samples and the cursors of the users."""
+        return dict(offsets=self.offsets, sampleIDs=self.sampleIDs, cursors=self.cursors)
+
+    def load_state_dict(self, state):
+        """Restore the assignment and the cursors saved by `state_dict`."""
+        self.offsets = np.array(state["offsets"], dtype=np.int64)
+        self.sampleIDs = np.array(state["sampleIDs"], dtype=np.int64)
+        self.cursors = np.array(state["cursors"], dtype=np.int64)
+        self.num_samples = np.diff(self.offsets)
+
+    def _move_cursors(self, userIDs, batch_size):
+        """Bump the cursors of the users and reshuffle the users which wrap around."""
+        cursors = self.cursors[userIDs] + batch_size
+        num_samples = self.num_samples[userIDs]
+        self.cursors[userIDs] = cursors % np.maximum(num_samples, 1)
+
+        if self.shuffle:
+            for userID in userIDs[cursors >= num_samples]:
+                np.random.shuffle(self[userID])
+
+
 def assign_data(train_dataset, iid=1, num_users=1, **kwargs):
     """
-    Assign train_dataset to multiple users.
+    Assign train_dataset to multiple users in O(num_samples) numpy operations.
 
     Args:
         train_dataset (dict):     a train_dataset which contains training samples and labels. 
         iid (bool/int):     whether the train_dataset is allocated as iid or non-iid distribution.
         num_users (int):     the number of users.
-        labels_per_user:      number of labels assigned to the user in no-iid setting.
+        labels_per_user:      number of label shards assigned to the user in no-iid setting.
+        alpha (float):        if positive, the no-iid label skew follows Dirichlet(alpha) instead of shards.
+        min_samples (int):    the least number of samples of a user in the Dirichlet mode.
 
     Returns:
-        dict:  keys denote userID ranging from [0,...,num_users-1] and values are sampleID
-               ranging from [0,...,num_samples]
-    
+        tuple:  (offsets, sampleIDs) in a CSR layout, the sampleIDs of userID ranging from [0,...,num_users-1] 
+                are sampleIDs[offsets[userID]:offsets[userID+1]].
     """
     
     try:
-        num_samples = train_dataset["labels"].shape[0]
-        samples_per_user = num_samples // num_users
+        labels = np.asarray(train_dataset["labels"])
+        num_samples = labels.shape[0]
     except KeyError:
         logging.error("Input train_dataset dictionary doesn't cotain key 'labels'.")
 
-    user_with_data = {}
-    userIDs = np.arange(num_users)
-    sampleIDs = np.arange(num_samples)
-    np.random.shuffle(userIDs)
-    np.random.shuffle(sampleIDs)
-    
-    # Assign the train_dataset in an iid fashion
     if iid:
-        for userID in userIDs:
-            user_with_data[userID] = sampleIDs[userID*samples_per_user: (userID+1)*samples_per_user].tolist()
-
-    # Assign the train_dataset in a no-iid fashion:
-    # n = labels_per_user must be included in **kwargs (default:1) 
-    # each user is assigned with num_samples/(n*num_users) samples
+        samples_per_user = num_samples // num_users
+        sampleIDs = np.random.permutation(num_samples)[:num_users*samples_per_user]
+        offsets = np.arange(num_users + 1) * samples_per_user
+    elif kwargs.get("alpha", 0) > 0:
+        offsets, sampleIDs = _dirichlet_partition(labels, num_users, kwargs["alpha"], kwargs.get("min_samples", 1))
     else:
-        idxs_ascending_labels = np.argsort(train_dataset["labels"])
-        numLabels = train_dataset["labels"][idxs_ascending_labels[-1]] + 1   # num_of_labels = last_label + 1
-        iter = 0
-        current_label = 0
-        num_of_samples_per_label = num_samples // numLabels
-        for iter, userID in enumerate(userIDs):
-            if iter*samples_per_user <= (current_label + 1)*num_of_samples_per_label:
-                user_with_data[userID] = idxs_ascending_labels[userID*samples_per_user:(userID + 1)*samples_per_user].tolist()
-            else:
-                user_with_data[userID] = idxs_ascending_labels[userID*samples_per_user:(userID + 1)*num_of_samples_per_label].tolist()
-                current_label += 1
-
-    return user_with_data
+        offsets, sampleIDs = _shard_partition(labels, num_users, kwargs.get("labels_per_user", 1))
+
+    return offsets, sampleIDs
+
+def _sort_by_label(labels):
+    """Shuffle the samples and group them by label. A stable sort on 16-bit keys 
+    is a radix sort in numpy, i.e., O(num_samples).
+    """
+    shuffledIDs = np.random.permutation(labels.shape[0])
+    order = np.argsort(labels[shuffledIDs].astype(np.uint16), kind="stable")
+    return shuffledIDs[order]
+
+def _shard_partition(labels, num_users, labels_per_user):
+    """Cut the label-sorted samples into num_users*labels_per_user shards and deal 
+    labels_per_user random shards to every user.
+    """
+    num_shards = num_users * labels_per_user
+    shard_size = labels.shape[0] // num_shards
+    
+    sortedIDs = _sort_by_label(labels)[:num_shards*shard_size]
+    shards = sortedIDs.reshape(num_shards, shard_size)
+    sampleIDs = shards[np.random.permutation(num_shards)].flatten()
+    offsets = np.arange(num_users + 1) * labels_per_user * shard_size
+
+    return offsets, sampleIDs
+
+def _dirichlet_partition(labels, num_users, alpha, min_samples=1):
+    """Split the samples of each label among the users with proportions drawn from Dirichlet(alpha).
+    Every user is topped up to at least min_samples samples.
+    """
+    sortedIDs = _sort_by_label(labels)
+    label_counts = np.bincount(labels)
+    num_labels = label_counts.shape[0]
+
+    if labels.shape[0] < num_users * min_samples:
+        logging.error("{:d} samples cannot give {:d} samples to each of {:d} users.".format(
+                      labels.shape[0], min_samples, num_users))
+        min_samples = labels.shape[0] // num_users
+
+    # counts[c, u]: the number of samples of label c assigned to user u
+    proportions = np.random.dirichlet(alpha * np.ones(num_users), size=num_labels)
+    boundaries = np.floor(np.cumsum(proportions, axis=1) * label_counts[:, None]).astype(np.int64)
+    boundaries[:, -1] = label_counts
+    counts = np.diff(boundaries, axis=1, prepend=0)
+    _fill_users(counts, min_samples)
+
+    # the blocks are label-major in sortedIDs and are moved to user-major order
+    offsets = np.zeros(num_users + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts.sum(axis=0))
+    dst_starts = offsets[:-1] + np.cumsum(counts, axis=0) - counts
+    src_starts = np.cumsum(counts.flatten()) - counts.flatten()
+    destinations = np.repeat(dst_starts.flatten() - src_starts, counts.flatten()) + np.arange(labels.shape[0])
+
+    sampleIDs = np.empty_like(sortedIDs)
+    sampleIDs[destinations] = sortedIDs
+
+    return offsets, sampleIDs
+
+def _fill_users(counts, min_samples):
+    """Move samples from the largest users to the users with fewer than min_samples samples in place.
+    A donor gives its most frequent label, so the moved samples keep the label skew of the donor.
+
+    Args:
+        counts (np.ndarray):    counts[c, u] is the number of samples of label c assigned to user u.
+        min_samples (int):      the least number of samples of a user, at most the mean number of samples.
+    """
+    totals = counts.sum(axis=0)
+    for userID in np.flatnonzero(totals < min_samples):
+        while totals[userID] < min_samples:
+            donorID = np.argmax(totals)
+            label = np.argmax(counts[:, donorID])
+            moved = min(min_samples - totals[userID], counts[label, donorID], totals[donorID] - min_samples)
+            counts[label, donorID] -= moved
+            counts[label, userID] += moved
+            totals[donorID] -= moved
+            totals[userID] += moved
 
 def assign_user_data(config):
     """
@@ -84,41 +253,79 @@ def assign_user_data(config):
         config (class):    a configuration class.
     
     Returns:
-        dict: a dict contains train_data, test_data and user_with_data[userID:sampleID].
+        dict: a dict contains train_data, test_data and user_with_data as a UserSampler,
+              as well as train_store and test_store on the device if `config.device_data` is set.
     """
     
-    with open(config.train_data_dir, "rb") as fp:
-        train_data = pickle.load(fp)
-    
-    with open(config.test_data_dir, "rb") as fp:
-        test_data = pickle.load(fp)
+    if config.mmap_data:
+        train_data = load_mmap_dataset(config.train_data_dir)
+        test_data = load_mmap_dataset(config.test_data_dir)
+    else:
+        with open(config.train_data_dir, "rb") as fp:
+            train_data = pickle.load(fp)
+        
+        with open(config.test_data_dir, "rb") as fp:
+            test_data = pickle.load(fp)
 
-    user_with_data = assign_data(train_dataset=train_data, 
+    offsets, sampleIDs = assign_data(train_dataset=train_data, 
                               iid=config.iid, 
                               num_users=config.users, 
-                              labels_per_user=config.labels_per_user)
+                              labels_per_user=config.labels_per_user,
+                              alpha=config.dirichlet_alpha,
+                              min_samples=config.local_batch_size)
+    user_with_data = UserSampler(offsets, sampleIDs, shuffle=config.reshuffle_user_data)
 
-    return dict(train_data=train_data,
+    dataset = dict(train_data=train_data,
                 test_data=test_data,
                 user_with_data=user_with_data)
 
+    if config.device_data:
+        dataset["train_store"] = DeviceDataset(train_data["images"], train_data["labels"], device=config.device)
+        dataset["test_store"] = DeviceDataset(test_data["images"], test_data["labels"], device=config.device)
+
+    return dataset
+
 def assign_user_resource(config, userID, train_dataset, user_with_data):
     """Simulate one user resource by assigning one batch_size of data.
+    If `train_dataset` is a DeviceDataset, only the sample indices are assigned.
+    """
+    # the cursor of the user moves to the next batch
+    sampleIDs = user_with_data.next_batch(userID, config.local_batch_size)
+    return sample_resource(config, sampleIDs, train_dataset)
+
+def sample_resource(config, sampleIDs, train_dataset):
+    """Simulate one user resource with the given samples, e.g., the batch drawn by 
+    the sampler of the server for a user which is run in a worker process.
     """
     user_resource = {}
-    batch_size = config.local_batch_size
     user_resource["lr"] = config.lr
     user_resource["device"] = config.device
     user_resource["batch_size"] = config.local_batch_size
+    _assign_samples(user_resource, sampleIDs, train_dataset)
 
-    sampleIDs = user_with_data[userID][:batch_size]
-    user_resource["images"] = train_dataset["images"][sampleIDs]
-    user_resource["labels"] = train_dataset["labels"][sampleIDs]
+    return user_resource
 
-    # As a batch of data has been fetched, it should be put at the end of the sampleIDs list
-    user_with_data_copy = user_with_data[userID]
-    user_with_data[userID][:-batch_size] = user_with_data_copy[batch_size:]
-    user_with_data[userID][-batch_size:] = user_with_data_copy[:batch_size]
+def assign_cohort_resource(config, userIDs, train_dataset, user_with_data):
+    """Simulate the resources of a cohort of users by assigning one batch_size of data to 
+    each of them. The samples are stacked in the first dimension by user, and `batch_sizes` 
+    holds the number of samples of each user at the start of its row.
+    """
+    cohort_resource = {}
+    cohort_resource["lr"] = config.lr
+    cohort_resource["device"] = config.device
+    cohort_resource["batch_size"] = config.local_batch_size
+    cohort_resource["userIDs"] = np.asarray(userIDs)
 
-    return user_resource
+    sampleIDs, cohort_resource["batch_sizes"] = user_with_data.next_batches(userIDs, config.local_batch_size)
+    _assign_samples(cohort_resource, sampleIDs, train_dataset)
+
+    return cohort_resource
 
+def _assign_samples(resource, sampleIDs, train_dataset):
+    """Assign the samples themselves, or their indices for a DeviceDataset."""
+    if isinstance(train_dataset, DeviceDataset):
+        resource["store"] = train_dataset
+        resource["sampleIDs"] = torch.from_numpy(sampleIDs).to(train_dataset.device)
+    else:
+        resource["images"] = train_dataset["images"][sampleIDs]
+        resource["labels"] = train_dataset["labels"][sampleIDs]
@@ -0,0 +1,58 @@
+import numpy as np
+
+# PyTorch Libraries
+import torch
+
+# My libraries
+from deeplearning.dataset import DeviceDataset
+
+class StreamingEvaluator(object):
+    def __init__(self, dataset, batch_size=1024, device="cuda", num_samples=None, seed=0):
+        """Evaluate the accuracy of a model chunk by chunk. The correct predictions are
+        counted on the device and synchronized once per evaluation.
+
+        Args:
+            dataset (dict/DeviceDataset):   a dataset which contains images and labels.
+            batch_size (int):               number of samples in a chunk.
+            device (str):                   set 'cuda' or 'cpu' for the evaluation.
+            num_samples (int):              if set, evaluate on a fixed random subset of the dataset.
+            seed (int):                     the seed of the subset, drawn apart from the global random state
+                                            so that the sampling of the training does not depend on it.
+        """
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.device = device
+
+        total_samples = len(dataset) if isinstance(dataset, DeviceDataset) else dataset["labels"].shape[0]
+        if num_samples is None or num_samples >= total_samples:
+            self.sampleIDs = None
+            self.num_samples = total_samples
+        else:
+            rng = np.random.default_rng(seed)
+            self.sampleIDs = np.sort(rng.choice(total_samples, num_samples, replace=False))
+            self.num_samples = num_samples
+
+    def _chunks(self):
+        """Iterate over normalized chunks of images and labels on the device."""
+        for start in range(0, self.num_samples, self.batch_size):
+            end = min(start + self.batch_size, self.num_samples)
+            chunk = slice(start, end) if self.sampleIDs is None else self.sampleIDs[start:end]
+
+            if isinstance(self.dataset, DeviceDataset):
+                if self.sampleIDs is not None:
+                    chunk = torch.from_numpy(chunk).to(self.dataset.device)
+                yield self.dataset.fetch(chunk)
+            else:
+                images = torch.from_numpy(self.dataset["images"][chunk].astype(np.float32)/255)
+                labels = torch.from_numpy(self.dataset["labels"][chunk].astype(np.int64))
+                yield images.to(self.device), labels.to(self.device)
+
+    def accuracy(self, model):
+        """Return the accuracy of the model on the evaluated samples."""
+        correct = torch.zeros(1, dtype=torch.int64, device=self.device)
+        with torch.inference_mode():
+            for images, labels in self._chunks():
+                results = model(images)
+                correct += (torch.argmax(results, dim=1) == labels).sum()
+
+        return correct.item() / self.num_samples
@@ -0,0 +1,49 @@
+import os
+import pickle
+import logging
+import numpy as np
+
+images_file = "images.npy"
+labels_file = "labels.npy"
+
+def convert_dataset(src_path, dst_dir):
+    """
+    Convert a pickled {"images", "labels"} dataset into .npy files which can be memory-mapped.
+
+    Args:
+        src_path (str):     the pickled dataset.
+        dst_dir (str):      the directory to store images.npy and labels.npy.
+    """
+    with open(src_path, "rb") as fp:
+        dataset = pickle.load(fp)
+
+    images = np.asarray(dataset["images"])
+    labels = np.asarray(dataset["labels"]).astype(np.int64)
+
+    # pixels are stored as uint8 whenever the conversion is lossless
+    if images.dtype != np.uint8:
+        if np.array_equal(images, images.astype(np.uint8)):
+            images = images.astype(np.uint8)
+        else:
+            logging.warning("Images of {:s} are not uint8 pixels, keep {:s}.".format(src_path, str(images.dtype)))
+
+    if not os.path.exists(dst_dir):
+        os.makedirs(dst_dir)
+    np.save(os.path.join(dst_dir, images_file), np.ascontiguousarray(images))
+    np.save(os.path.join(dst_dir, labels_file), np.ascontiguousarray(labels))
+
+def load_mmap_dataset(data_dir):
+    """
+    Open a dataset converted by `convert_dataset` with read-only memory maps.
+    The pages are loaded on demand and shared by all processes opening the same files.
+
+    Args:
+        data_dir (str):     the directory which contains images.npy and labels.npy.
+
+    Returns:
+        dict: a dict contains images and labels.
+    """
+    images = np.load(os.path.join(data_dir, images_file), mmap_mode="r")
+    labels = np.load(os.path.join(data_dir, labels_file), mmap_mode="r")
+
+    return dict(images=images, labels=labels)
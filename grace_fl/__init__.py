@@ -1,11 +1,18 @@
 """
 Refer to grace: https://github.com/sands-lab/grace
 """
+import copy
 from abc import ABC, abstractmethod
 
+import numpy as np
+import torch
+
 class Compressor(ABC):
     """Interface for compressing and decompressing a given tensor."""
 
+    # whether `vote` counts the packed sign codes of `aggregate_packed` and `aggregate_hierarchical`
+    packed_vote = False
+
     def __init__(self):
         self._require_grad_idx = False
 
@@ -24,22 +31,136 @@ class Compressor(ABC):
     def reset(self):
         """Reset the status."""
 
-    def trans_aggregation(self, tensor):
-        """Transform a raw aggregation sum."""
+    def state_dict(self):
+        """The counters and flags of the compressor."""
+        return {key: value for key, value in vars(self).items() if isinstance(value, (bool, int, float, np.number))}
+
+    def counters(self):
+        """The numeric items of `state_dict` which `reset` clears, e.g., to sum the counters of 
+        the compressors of several processes."""
+        cleared = copy.copy(self)
+        cleared.reset()
+        clearedState = cleared.state_dict()
+        return {key: value for key, value in self.state_dict().items() 
+                if not isinstance(value, bool) and clearedState.get(key) == 0}
+
+    def load_state_dict(self, state):
+        """Restore the counters and flags saved by `state_dict`."""
+        for key, value in state.items():
+            setattr(self, key, value)
+
+    def trans_aggregation(self, tensor, num_clients=None):
+        """Transform a raw aggregation sum of num_clients clients, None for the configured cohort."""
 
     def aggregate(self, tensors):
         """Aggregate a list of tensors."""
         return sum(tensors)
 
+    def accumulate(self, codes, counts):
+        """Add the decompressed codes of a client into the vote counts in place."""
+        counts.add_(self.decompress(codes, counts.shape).to(counts.dtype))
+
+    def accumulate_with_reference(self, codes, refTensor, counts):
+        """Add the codes of a client decompressed with the packed reference into the vote counts in place."""
+        counts.add_(self.decompress_with_reference(codes, refTensor, counts.shape).to(counts.dtype))
+
+    def payload_bits(self, codes):
+        """Number of bits of the codes sent over the network."""
+        return packed_bits(codes)
+
+    def packed_signs(self, codes, numel, refTensor=None):
+        """The packed sign words of the codes of a client, the domain of `aggregate_packed`.
+
+        Args,
+            codes (torch.tensor):       the codes of `compress`, or of `compress_with_reference` if refTensor is set.
+            numel (int):                the number of elements of the compressed tensor.
+            refTensor (torch.tensor):   the packed reference of `compress_with_reference`.
+        """
+        if refTensor is None:
+            return codes
+        return codes ^ refTensor
+
+    def vote(self, counts, num_clients):
+        """Transform the per-coordinate counts of 1 bits from packed sign codes."""
+        raise NotImplementedError("{:s} has no majority vote over packed sign codes, "
+                                  "disable packed_aggregation and edge_fan_out.".format(self.__class__.__name__))
+
+    def pack_reference(self, refTensor, out=None):
+        """Pack the signs of a reference tensor, the references of `compress_with_reference` are kept packed.
+        Packed residual codes XOR the packed reference give packed sign codes.
+
+        Args,
+            refTensor (torch.tensor):   the reference tensor, a "+" sign (or indicator) where it is positive.
+            out (torch.tensor):         if set, the packed reference is updated in place.
+        """
+        return pack_bits(refTensor > 0, dtype=self.dtype, out=out)
+
+    def aggregate_packed(self, codes, shape):
+        """Majority vote over a list of packed sign codes, one per client.
+        The result equals `trans_aggregation` of the sum of the decompressed codes.
+        """
+        counts = count_votes(torch.stack(codes), num_elements(shape))
+        return self.vote(counts, len(codes)).view(shape)
+
+    def aggregate_hierarchical(self, codes, shape, fan_outs, reduce="counts", executor=None):
+        """Majority vote over a list of packed sign codes through a tree of edge aggregators.
+        The edges of the first tier count the votes of fan_outs[0] clients each, the edges of tier k
+        reduce fan_outs[k] edges of the tier below, and the server reduces the last tier.
+
+        Args,
+            codes (list):               the packed sign codes, one per client.
+            shape (torch.Size):         the shape of the aggregated tensor.
+            fan_outs (list):            the fan-out of every tier of edges.
+            reduce (str):               "counts" forwards the integer vote counts, which gives the flat 
+                                        majority vote, "sign" forwards the packed majority sign of each edge.
+            executor (Executor):        if set, the edges of a tier are reduced in parallel.
+
+        Returns:
+            tuple:  the aggregated tensor and the bits forwarded by each tier of edges.
+        """
+        numel = num_elements(shape)
+        mapper = map if executor is None else executor.map
+        countGroup = lambda group: count_votes(torch.stack(group), numel)
+
+        groups = edge_groups(codes, fan_outs[0])
+        counts = list(mapper(countGroup, groups))
+        sizes = [len(group) for group in groups]
+
+        # None stands for the server, which reduces every edge of the last tier
+        tierBits = []
+        for fanOut in list(fan_outs[1:]) + [None]:
+            if reduce == "sign":
+                majorities = list(mapper(lambda edgeCounts, size: pack_bits(self.vote(edgeCounts, size) > 0, dtype=self.dtype),
+                                         counts, sizes))
+                tierBits.append(sum(packed_bits(majority) for majority in majorities))
+                groups = edge_groups(majorities, fanOut or len(majorities))
+                counts = list(mapper(countGroup, groups))
+                sizes = [len(group) for group in groups]
+            else:
+                tierBits.append(sum(numel * count_width(size) for size in sizes))
+                groups = edge_groups(list(zip(counts, sizes)), fanOut or len(counts))
+                counts = [sum(edgeCounts for edgeCounts, _ in group) for group in groups]
+                sizes = [sum(size for _, size in group) for group in groups]
+
+        return self.vote(counts[0], sizes[0]).view(shape), tierBits
+
+
+from grace_fl.packing import pack_bits, packed_bits, num_elements
+from grace_fl.aggregation import count_votes, count_width, edge_groups
+
 
 from grace_fl.signSGD import SignSGDCompressor
 from grace_fl.pred_signSGD import PredSignSGDCompressor
 from grace_fl.pred_RLE_signSGD import PredRLESignSGDCompressor
 from grace_fl.ideal_pred_signSGD import IdealBinaryPredSignSGDCompressor
+from grace_fl.rans_pred_signSGD import RANSPredSignSGDCompressor
+from grace_fl.golomb_pred_signSGD import GolombPredSignSGDCompressor
 
 compressor_registry = {
 "signSGD": SignSGDCompressor,
 "pred_signSGD": PredSignSGDCompressor,
 "ideal_pred_signSGD": IdealBinaryPredSignSGDCompressor,
-"pred_rle_signSGD": PredRLESignSGDCompressor
+"pred_rle_signSGD": PredRLESignSGDCompressor,
+"rans_pred_signSGD": RANSPredSignSGDCompressor,
+"golomb_pred_signSGD": GolombPredSignSGDCompressor
 }
@@ -0,0 +1,70 @@
+import torch
+
+# My libraries
+from grace_fl.packing import unpack_bits
+import grace_fl.constant as const
+
+def _add_planes(planesA, planesB):
+    """Add two bit-sliced integers with a ripple carry over their bit planes."""
+    planes = []
+    carry = None
+    for planeA, planeB in zip(planesA, planesB):
+        partialSum = planeA ^ planeB
+        if carry is None:
+            planes.append(partialSum)
+            carry = planeA & planeB
+        else:
+            planes.append(partialSum ^ carry)
+            carry = (planeA & planeB) | (carry & partialSum)
+    planes.append(carry)
+
+    return planes
+
+def count_votes(packedTensors, numel, dtype=torch.int32):
+    """Count the 1 bits of every coordinate over a stack of packed client words.
+
+    The clients are reduced pairwise with bitwise adders on 64-bit words, so a coordinate
+    never leaves the packed domain until the final count.
+
+    Args,
+        packedTensors (torch.tensor):   packed words of the clients stacked in the first dimension.
+        numel (int):                    the number of elements before packing.
+        dtype (torch.dtype):            the integer type of the returned counts.
+    """
+    numClients = packedTensors.shape[0]
+    words = packedTensors.reshape(numClients, -1).view(torch.uint8)
+    padding = (-words.shape[1]) % (const.DOUBLE_WORD_BIT // const.BYTE_BIT)
+    if padding != 0:
+        words = torch.cat((words, words.new_zeros((numClients, padding))), dim=1)
+    words = words.view(torch.int64)
+
+    # each level of the adder tree halves the clients and adds one bit plane
+    planes = [words]
+    while planes[0].shape[0] > 1:
+        if planes[0].shape[0] % 2 == 1:
+            planes = [torch.cat((plane, plane.new_zeros((1, plane.shape[1])))) for plane in planes]
+        planes = _add_planes([plane[0::2] for plane in planes], [plane[1::2] for plane in planes])
+
+    counts = torch.zeros(numel, dtype=dtype, device=packedTensors.device)
+    for k, plane in enumerate(planes):
+        counts.add_(unpack_bits(plane[0], numel), alpha=2**k)
+
+    return counts
+
+def count_width(num_clients):
+    """Bits of an unsigned count of up to num_clients votes."""
+    return max(int(num_clients).bit_length(), 1)
+
+def edge_groups(items, fan_out):
+    """Split the items into consecutive groups of at most fan_out items, one group per edge."""
+    return [items[k:k+fan_out] for k in range(0, len(items), fan_out)]
+
+def vote_dtype(num_clients):
+    """The narrowest signed integer type which holds the vote counts of num_clients clients."""
+    if num_clients is None:
+        return torch.int32
+    elif num_clients <= torch.iinfo(torch.int8).max:
+        return torch.int8
+    elif num_clients <= torch.iinfo(torch.int16).max:
+        return torch.int16
+    return torch.int32
@@ -0,0 +1,119 @@
+import numpy as np
+from abc import abstractmethod
+
+# PyTorch Libraries
+import torch
+
+# My libraries
+from grace_fl.ideal_pred_signSGD import IdealBinaryPredSignSGDCompressor
+from grace_fl.packing import pack_bits, unpack_bits, num_elements
+import grace_fl.constant as const
+
+class CodedPredSignSGDCompressor(IdealBinaryPredSignSGDCompressor):
+    """Predictive signSGD whose signs and residuals are coded into real uint8 streams by `encode_bits`/`decode_bits`."""
+    def __init__(self, config):
+        super().__init__(config)
+
+        # raw bits of the input tensors & bits of the coded streams & bits of their fixed headers
+        self.raw_bits = 0
+        self.coded_bits = 0
+        self.header_bits = 0
+
+    def compress(self, tensor):
+        """
+        Compress the signs of the input tensor into a coded stream.
+
+        Args,
+            tensor (torch.tensor):  the input tensor.
+        """
+        encodedTensor = self._encode(tensor>0)
+        return encodedTensor
+
+    def compress_with_reference(self, tensor, ref_tensor):
+        """
+        Given a reference tensor, compress the sign flips between the input tensor and the reference into a coded stream.
+
+        Args,
+            tensor (torch.tensor):  the input tensor.
+            ref_tensor (torch.tensor): the packed reference signs.
+        """
+        residual = ((tensor>0) != unpack_bits(ref_tensor, tensor.numel()).view_as(tensor))
+        encodedTensor = self._encode(residual)
+
+        self.total_symbols += np.prod(residual.shape)
+        self.residual_symbols += torch.sum(residual).item()
+
+        return encodedTensor
+
+    @abstractmethod
+    def encode_bits(self, bits):
+        """Code a flat bool array into a uint8 array."""
+
+    @abstractmethod
+    def decode_bits(self, payload, numel):
+        """Decode a uint8 array into a flat bool array of numel elements."""
+
+    def header_bytes(self, numel):
+        """Bytes of a payload of numel symbols which do not depend on the symbols."""
+        return 0
+
+    def _encode(self, bits):
+        """Code a binary tensor into a uint8 tensor and account the coded bits."""
+        payload = self.encode_bits(bits.flatten().cpu().numpy())
+
+        self.raw_bits += bits.numel() * const.FLOAT_BIT
+        self.coded_bits += payload.shape[0] * const.BYTE_BIT
+        self.header_bits += self.header_bytes(bits.numel()) * const.BYTE_BIT
+        return torch.from_numpy(payload).to(bits.device)
+
+    def _decode(self, codes, numel):
+        """Decode a uint8 tensor into a flat bool tensor."""
+        bits = self.decode_bits(codes.cpu().numpy(), numel)
+        return torch.from_numpy(bits).to(codes.device)
+
+    def decompress(self, codes, shape):
+        """Decode the coded signs to float format."""
+        decoded_tensor = self._decode(codes, num_elements(shape))
+        decoded_tensor = decoded_tensor.to(torch.float32)
+        decoded_tensor = decoded_tensor.view(shape)
+        decoded_tensor = 2*decoded_tensor - 1
+        return decoded_tensor
+
+    def _decode_with_reference(self, codes, ref_tensor, numel):
+        """Decode the coded sign flips and apply them to the packed reference signs."""
+        return self._decode(codes, numel) ^ unpack_bits(ref_tensor, numel)
+
+    def packed_signs(self, codes, numel, refTensor=None):
+        """Decode the coded stream into packed sign words, so that the packed modes vote over them."""
+        if refTensor is None:
+            bits = self._decode(codes, numel)
+        else:
+            bits = self._decode_with_reference(codes, refTensor, numel)
+        return pack_bits(bits, dtype=self.dtype)
+
+    @property
+    def compress_ratio(self):
+        """Ratio between the raw bits and the bits of the coded streams."""
+        if self.coded_bits == 0:
+            return const.FLOAT_BIT/const.BINARY_BIT
+        return self.raw_bits / self.coded_bits
+
+    @property
+    def ideal_compress_ratio(self):
+        """The entropy estimation of the residuals, i.e., the ratio of an ideal coder."""
+        if self.total_symbols == 0:
+            return self.compress_ratio
+        return super().compress_ratio
+
+    @property
+    def header_overhead(self):
+        """Fraction of the coded bits spent on the fixed headers, which keeps small tensors away from the ideal ratio."""
+        if self.coded_bits == 0:
+            return 0.
+        return self.header_bits / self.coded_bits
+
+    def reset(self):
+        super().reset()
+        self.raw_bits = 0
+        self.coded_bits = 0
+        self.header_bits = 0
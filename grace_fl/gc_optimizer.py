@@ -1,4 +1,6 @@
 import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 # PyTorch libraries
 import torch
@@ -6,10 +8,14 @@ import torch.nn as nn
 from torch.utils.data import DataLoader
 import torch.optim as optim
 from torch.optim import Optimizer
+from torch.func import functional_call, grad, vmap
 
 # My libraries
 import grace_fl.constant as const
+from grace_fl.packing import pack_bits, unpack_bits, packed_bits, num_elements
+from grace_fl.aggregation import vote_dtype
 from deeplearning import UserDataset
+from utils import RoundProfiler
 
 class LocalUpdater(object):
     def __init__(self, user_resource):
@@ -29,16 +35,19 @@ class LocalUpdater(object):
             self.batchSize = user_resource["batch_size"]
             self.device = user_resource["device"]
 
-            assert("images" in user_resource)
-            assert("labels" in user_resource)
+            assert(("images" in user_resource and "labels" in user_resource) or "sampleIDs" in user_resource)
         except KeyError:
             logging.error("LocalUpdater Initialization Failure! Input should include `lr`, `batchSize`!") 
         except AssertionError:
             logging.error("LocalUpdater Initialization Failure! Input should include samples!") 
 
-        self.sampleLoader = DataLoader(UserDataset(user_resource["images"], user_resource["labels"]), 
-                                batch_size=self.batchSize
-                            )
+        # samples held by a DeviceDataset are normalized when the batch is fetched
+        if "sampleIDs" in user_resource:
+            self.sampleLoader = user_resource["store"].loader(user_resource["sampleIDs"], self.batchSize)
+        else:
+            self.sampleLoader = DataLoader(UserDataset(user_resource["images"], user_resource["labels"]), 
+                                    batch_size=self.batchSize
+                                )
         self.criterion = nn.CrossEntropyLoss()
 
     def local_step(self, model, optimizer, **kwargs):
@@ -49,11 +58,153 @@ class LocalUpdater(object):
             image = sample["image"].to(self.device)
             label = sample["label"].to(self.device)
 
-            output = model(image)
-            loss = self.criterion(output, label)
-            loss.backward()
+            with optimizer.profiler.phase("forward"):
+                output = model(image)
+                loss = self.criterion(output, label)
+            with optimizer.profiler.phase("backward"):
+                loss.backward()
             optimizer.gather(**kwargs)
 
+class BatchLocalUpdater(object):
+    def __init__(self, cohort_resource, chunk_size):
+        """Construct a local updater for a cohort of users whose gradients are computed together.
+
+        Args:
+            cohort_resource (dict): resource of the cohort with one batch of `images` and `labels`
+                                    (or `sampleIDs` of a DeviceDataset) per user, stacked by user, 
+                                    and the `batch_sizes` of the users, the rest of a row is padding.
+            chunk_size (int):       number of users whose gradients are computed at once.
+        """
+        try:
+            self.device = cohort_resource["device"]
+            if "sampleIDs" in cohort_resource:
+                self.images, self.labels = cohort_resource["store"].fetch(cohort_resource["sampleIDs"])
+            else:
+                images = cohort_resource["images"]
+                labels = cohort_resource["labels"]
+                self.images = torch.from_numpy(images.astype(np.float32)/255).to(self.device)
+                self.labels = torch.from_numpy(labels.astype(np.int64)).to(self.device)
+            self.batchSizes = np.asarray(cohort_resource["batch_sizes"])
+        except KeyError:
+            logging.error("BatchLocalUpdater Initialization Failure! Input should include `device` and samples!")
+
+        # the padded samples of a row are masked out of the loss of the user
+        batchSizes = torch.from_numpy(self.batchSizes).to(self.device)
+        self.masks = (torch.arange(self.labels.shape[1], device=self.device) < batchSizes[:, None]).to(torch.float32)
+
+        self.userIDs = cohort_resource.get("userIDs")
+        self.chunkSize = chunk_size
+        self.criterion = nn.CrossEntropyLoss(reduction="none")
+
+    def local_step(self, model, optimizer, **kwargs):
+        """Compute the gradients of the users chunk by chunk with vmap and gather them one user at a time."""
+        params = {name: param.detach() for name, param in model.named_parameters()}
+        buffers = {name: buffer.detach() for name, buffer in model.named_buffers()}
+
+        # the mean loss over the samples of a user, as in the serial LocalUpdater
+        def compute_loss(params, image, label, mask):
+            output = functional_call(model, (params, buffers), (image,))
+            return (self.criterion(output, label) * mask).sum() / mask.sum().clamp(min=1)
+
+        batch_grad = vmap(grad(compute_loss), in_dims=(None, 0, 0, 0))
+        
+        numUsers = self.labels.shape[0]
+        for start in range(0, numUsers, self.chunkSize):
+            end = min(start + self.chunkSize, numUsers)
+            with optimizer.profiler.phase("batch_grad"):
+                grads = batch_grad(params, self.images[start:end], self.labels[start:end], self.masks[start:end])
+
+            for user in range(end - start):
+                # a user without samples sends nothing, like the empty loader of LocalUpdater
+                if self.batchSizes[start + user] == 0:
+                    continue
+
+                for name, param in model.named_parameters():
+                    if param.grad is None:
+                        param.grad = grads[name][user].clone()
+                    else:
+                        param.grad.copy_(grads[name][user])
+                if self.userIDs is not None:
+                    kwargs["userID"] = self.userIDs[start + user]
+                optimizer.gather(**kwargs)
+
+class FlatParams(object):
+    def __init__(self, params):
+        """Move the parameters of a group and their gradients into two contiguous buffers. 
+        The parameters keep their shapes as views of the buffers, so the model is unchanged 
+        while the optimizer sees a single flat parameter.
+
+        Args:
+            params (list):  the parameters of a param_group.
+        """
+        self.shapes = [param.shape for param in params]
+        self.numels = [param.numel() for param in params]
+
+        flatData = torch.cat([param.data.flatten() for param in params])
+        self.param = nn.Parameter(flatData)
+        self.param.grad = torch.zeros_like(flatData)
+
+        paramViews = self.views(self.param.data)
+        gradViews = self.views(self.param.grad)
+        for param, paramView, gradView in zip(params, paramViews, gradViews):
+            param.data = paramView
+            param.grad = gradView
+
+    def views(self, tensor):
+        """Split a flat tensor into per-layer views."""
+        return [view.view(shape) for view, shape in zip(torch.split(tensor, self.numels), self.shapes)]
+
+class _serverMixin(object):
+    """
+    The gather and the hierarchical aggregation shared by the wrapper optimizers.
+    """
+    def gather(self, **kwargs):
+        """Gather local gradients.
+        """
+        self.receive(self.encode(**kwargs), **kwargs)
+
+    def _num_voters(self):
+        """The number of clients gathered in the round, which the majority thresholds count against, 
+        e.g., a quorum of an async round. The processes of a collective gather the whole cohort.
+        """
+        if self._collective is not None:
+            return None
+        return self._num_gathered
+
+    def _init_edges(self, **kwargs):
+        """Hierarchical mode keeps the packed codes like packed mode and reduces them through tiers of edges."""
+        self._edge_fan_out = list(kwargs.get("edge_fan_out", []))
+        self._edge_reduce = kwargs.get("edge_reduce", "counts")
+        self._edge_executor = None
+        if kwargs.get("edge_workers", 1) > 1:
+            self._edge_executor = ThreadPoolExecutor(max_workers=kwargs["edge_workers"])
+        self._packed = self._packed or len(self._edge_fan_out) > 0
+
+        if self._packed and not self.grace.packed_vote:
+            logging.error("packed_aggregation and edge_fan_out are not supported with {:s}, they are disabled."
+                          .format(self.grace.__class__.__name__))
+            self._packed = False
+            self._edge_fan_out = []
+
+    def _all_codes(self, i):
+        """The packed codes of a layer gathered from the users of every process."""
+        if self._collective is None:
+            return self._gatheredCodes[i]
+        return self._collective.all_gather_codes(self._gatheredCodes[i])
+
+    def _aggregate_edges(self, codes, shape):
+        """Aggregate the codes of a layer through the edges and account the bits of every tier."""
+        d_param, tierBits = self.grace.aggregate_hierarchical(codes, shape, self._edge_fan_out, 
+                                reduce=self._edge_reduce, executor=self._edge_executor)
+        if self.ledger is not None:
+            self.ledger.edges(tierBits)
+        return d_param
+
+    def close(self):
+        """Shut down the threads reducing the edges."""
+        if getattr(self, "_edge_executor", None) is not None:
+            self._edge_executor.shutdown()
+
 class _graceOptimizer(Optimizer):
     """
     A warpper optimizer gather gradients from local users and overwrite 
@@ -68,36 +219,104 @@ class _graceOptimizer(Optimizer):
         self.encodedBit = 0
         self.grace = grace
 
+        self.profiler = kwargs.get("profiler", RoundProfiler())
+        self.ledger = kwargs.get("ledger", None)
+
+        # the votes of the users of the other processes are joined by collectives
+        self._collective = kwargs.get("collective", None)
+
+        # packed mode keeps the packed codes of the clients and aggregates them by majority vote
+        self._packed = kwargs.get("packed", False)
+        self._init_edges(**kwargs)
         self._gatheredGradients = []
+        self._num_gathered = 0
+        self._gatheredCodes = []
+
+        # integer mode counts the votes in the narrowest integer type which holds the cohort
+        voteDtype = vote_dtype(kwargs.get("num_clients")) if kwargs.get("int_votes", False) else None
         for group in self.param_groups:
             for param in group["params"]:
-                self._gatheredGradients.append(torch.zeros_like(param))
+                self._gatheredGradients.append(torch.zeros_like(param, dtype=voteDtype))
+                self._gatheredCodes.append([])
 
-    def gather(self, **kwargs):
-        """Gather local gradients.
+    def encode(self, **kwargs):
+        """Compress the local gradients of a user, i.e., the user side of `gather`.
+
+        Returns:
+            list:  the codes of every parameter, None where the parameter has no gradient.
         """
+        codes = []
         for group in self.param_groups:
-            for i, param in enumerate(group['params']):
+            for param in group['params']:
                 if param.grad is None:
+                    codes.append(None)
                     continue
                     
-                encodedTensor = self.grace.compress(param.grad.data)
-                self._gatheredGradients[i] += self.grace.decompress(encodedTensor, shape=param.grad.data.shape)                
+                with self.profiler.phase("compress"):
+                    codes.append(self.grace.compress(param.grad.data))
                 
                 # clear the gradients for next step, which is equivalent to zero_grad()
                 param.grad.detach_()
                 param.grad.zero_() 
 
+        return codes
+
+    def receive(self, codes, **kwargs):
+        """Gather the codes of a user returned by `encode`, i.e., the server side of `gather`."""
+        uplinkBits = 0
+        for group in self.param_groups:
+            for i, param in enumerate(group['params']):
+                encodedTensor = codes[i]
+                if encodedTensor is None:
+                    continue
+
+                uplinkBits += self.grace.payload_bits(encodedTensor)
+                if self._packed:
+                    self._gatheredCodes[i].append(self.grace.packed_signs(encodedTensor, param.numel()))
+                else:
+                    with self.profiler.phase("decompress"):
+                        self.grace.accumulate(encodedTensor, self._gatheredGradients[i])                
+
+        self._num_gathered += 1
+        if self.ledger is not None:
+            self.ledger.uplink(kwargs.get("userID"), uplinkBits)
+
     def step(self, **kwargs):
         """Performs a single optimization step.
         """
+        downlinkBits = 0
         for group in self.param_groups:
             for i, param in enumerate(group['params']):
 
-                d_param = self.grace.trans_aggregation(self._gatheredGradients[i], **kwargs)
+                with self.profiler.phase("aggregation"):
+                    if self._edge_fan_out:
+                        d_param = self._aggregate_edges(self._all_codes(i), param.data.shape)
+                        self._gatheredCodes[i].clear()
+                    elif self._packed:
+                        d_param = self.grace.aggregate_packed(self._all_codes(i), shape=param.data.shape)
+                        self._gatheredCodes[i].clear()
+                    else:
+                        if self._collective is not None:
+                            self._collective.all_reduce(self._gatheredGradients[i])
+                        d_param = self.grace.trans_aggregation(self._gatheredGradients[i], 
+                                        num_clients=self._num_voters(), **kwargs)
                 param.data.add_(d_param, alpha=-group['lr'])
                 self._gatheredGradients[i].zero_()
 
+                # the majority signs are broadcast with one bit per coordinate
+                downlinkBits += num_elements(param.shape)
+
+        self._num_gathered = 0
+        if self.ledger is not None:
+            self.ledger.downlink(downlinkBits)
+
+    def buffer_state_dict(self):
+        """The server buffers besides the state of the wrapped optimizer."""
+        return {}
+
+    def load_buffer_state_dict(self, state):
+        """Restore the buffers saved by `buffer_state_dict`."""
+
 class _predOptimizer(Optimizer):
     """
     A warpper optimizer which implements predictive encoding with turn trick.
@@ -111,47 +330,108 @@ class _predOptimizer(Optimizer):
         super(self.__class__, self).__init__(params)
         self.grace = grace
 
+        self.profiler = kwargs.get("profiler", RoundProfiler())
+        self.ledger = kwargs.get("ledger", None)
+
+        # the votes of the users of the other processes are joined by collectives
+        self._collective = kwargs.get("collective", None)
+
+        # the reference of the predictive coding is the packed signs of the last broadcast
         self._buffer_empty = True
         self._gatheredGradients = []
+        self._num_gathered = 0
         self._buffer = []
 
+        # packed mode keeps the packed sign codes of the clients and aggregates them by majority vote
+        self._packed = kwargs.get("packed", False)
+        self._init_edges(**kwargs)
+        self._gatheredCodes = []
+
+        # integer mode counts the votes in the narrowest integer type which holds the cohort
+        voteDtype = vote_dtype(kwargs.get("num_clients")) if kwargs.get("int_votes", False) else None
         for group in self.param_groups:
             for param in group["params"]:
-                self._gatheredGradients.append(torch.zeros_like(param))
-                self._buffer.append(torch.zeros_like(param))
+                self._gatheredGradients.append(torch.zeros_like(param, dtype=voteDtype))
+                self._buffer.append(self.grace.pack_reference(torch.zeros_like(param)))
+                self._gatheredCodes.append([])
 
-    def gather(self, **kwargs):
-        """Gather local gradients.
+    def encode(self, **kwargs):
+        """Compress the local gradients of a user, i.e., the user side of `gather`.
+
+        Returns:
+            list:  the codes of every parameter, None where the parameter has no gradient.
         """
+        codes = []
         for group in self.param_groups:
-            momentum = group["momentum"]
             for i, param in enumerate(group['params']):
                 if param.grad is None:
+                    codes.append(None)
                     continue
 
                 # if buffer is empty, encode the gradient
-                if self._buffer_empty:
-                    encodedTensor = self.grace.compress(param.grad.data)
-                    self._gatheredGradients[i] += self.grace.decompress(encodedTensor, shape=param.grad.data.shape)
-                # if buffer is nonempty, encode the residual
-                else:
-                    encodedTensor = self.grace.compress_with_reference(param.grad.data, self._buffer[i])
-                    self._gatheredGradients[i] += self.grace.decompress_with_reference(encodedTensor, self._buffer[i])
+                with self.profiler.phase("compress"):
+                    if self._buffer_empty:
+                        codes.append(self.grace.compress(param.grad.data))
+                    # if buffer is nonempty, encode the residual
+                    else:
+                        codes.append(self.grace.compress_with_reference(param.grad.data, self._buffer[i]))
 
                 # clear the gradients for next step, which is equivalent to zero_grad()
                 param.grad.detach_()
                 param.grad.zero_() 
 
+        return codes
+
+    def receive(self, codes, **kwargs):
+        """Gather the codes of a user returned by `encode`, i.e., the server side of `gather`."""
+        uplinkBits = 0
+        for group in self.param_groups:
+            for i, param in enumerate(group['params']):
+                encodedTensor = codes[i]
+                if encodedTensor is None:
+                    continue
+
+                uplinkBits += self.grace.payload_bits(encodedTensor)
+                if self._buffer_empty:
+                    if self._packed:
+                        self._gatheredCodes[i].append(self.grace.packed_signs(encodedTensor, param.numel()))
+                    else:
+                        with self.profiler.phase("decompress"):
+                            self.grace.accumulate(encodedTensor, self._gatheredGradients[i])
+                else:
+                    if self._packed:
+                        self._gatheredCodes[i].append(self.grace.packed_signs(encodedTensor, param.numel(), self._buffer[i]))
+                    else:
+                        with self.profiler.phase("decompress"):
+                            self.grace.accumulate_with_reference(encodedTensor, self._buffer[i], self._gatheredGradients[i])
+
+        self._num_gathered += 1
+        if self.ledger is not None:
+            self.ledger.uplink(kwargs.get("userID"), uplinkBits)
+
 
     def step(self):
         """Performs a single optimization step.
         """
+        downlinkBits = 0
         for group in self.param_groups:
             momentum = group["momentum"]
 
             for i, param in enumerate(group['params']):
-                d_param = self.grace.trans_aggregation(self._gatheredGradients[i])
+                with self.profiler.phase("aggregation"):
+                    if self._edge_fan_out:
+                        d_param = self._aggregate_edges(self._all_codes(i), param.data.shape)
+                        self._gatheredCodes[i].clear()
+                    elif self._packed:
+                        d_param = self.grace.aggregate_packed(self._all_codes(i), shape=param.data.shape)
+                        self._gatheredCodes[i].clear()
+                    else:
+                        if self._collective is not None:
+                            self._collective.all_reduce(self._gatheredGradients[i])
+                        d_param = self.grace.trans_aggregation(self._gatheredGradients[i], num_clients=self._num_voters())
                 
+                # the majority signs are broadcast with one bit per coordinate unless they are encoded
+                broadcastBits = num_elements(param.shape)
                 if momentum != 0:
                     param_state = self.state[param]
                     if 'momentum_buffer' not in param_state:
@@ -161,24 +441,40 @@ class _predOptimizer(Optimizer):
                         buf.mul_(momentum).add_(d_param)
 
                     # compress the broadcast tensor
-                    if self._buffer_empty:
-                        encodedTensor = self.grace.compress(d_param)
-                        d_param = self.grace.decompress(encodedTensor, shape=param.data.shape)
-                    # if buffer is nonempty, encode the residual
-                    else:
-                        # ones_tensor = torch.ones_like(param)
-                        # d_param = torch.where(buf>0, ones_tensor, -ones_tensor)
-                        encodedTensor = self.grace.compress_with_reference(d_param, self._buffer[i])
-                        d_param = self.grace.decompress_with_reference(encodedTensor, self._buffer[i])
+                    with self.profiler.phase("broadcast"):
+                        if self._buffer_empty:
+                            encodedTensor = self.grace.compress(d_param)
+                            d_param = self.grace.decompress(encodedTensor, shape=param.data.shape)
+                        # if buffer is nonempty, encode the residual
+                        else:
+                            # ones_tensor = torch.ones_like(param)
+                            # d_param = torch.where(buf>0, ones_tensor, -ones_tensor)
+                            encodedTensor = self.grace.compress_with_reference(d_param, self._buffer[i])
+                            d_param = self.grace.decompress_with_reference(encodedTensor, self._buffer[i], shape=param.data.shape)
+                        broadcastBits = self.grace.payload_bits(encodedTensor)
             
                 param.data.add_(d_param, alpha=-group["lr"])
                 self._gatheredGradients[i].zero_()
+                downlinkBits += broadcastBits
                 
                 # register buffer
-                self._buffer[i] = torch.clone(d_param).detach()
+                self.grace.pack_reference(d_param, out=self._buffer[i])
 
+        self._num_gathered = 0
+        if self.ledger is not None:
+            self.ledger.downlink(downlinkBits)
         self._buffer_empty = False
 
+    def buffer_state_dict(self):
+        """The references of the predictive coding besides the state of the wrapped optimizer."""
+        return dict(buffer=self._buffer, buffer_empty=self._buffer_empty)
+
+    def load_buffer_state_dict(self, state):
+        """Restore the buffers saved by `buffer_state_dict`."""
+        for buffer, savedBuffer in zip(self._buffer, state["buffer"]):
+            buffer.copy_(savedBuffer)
+        self._buffer_empty = state["buffer_empty"]
+
 
 class _predTurnOptimizer(Optimizer):
     """
@@ -193,74 +489,159 @@ class _predTurnOptimizer(Optimizer):
         super(self.__class__, self).__init__(params)
         self.grace = grace
 
-        self._current_sign = 1
+        self.profiler = kwargs.get("profiler", RoundProfiler())
+        self.ledger = kwargs.get("ledger", None)
+
+        # the votes of the users of the other processes are joined by collectives
+        self._collective = kwargs.get("collective", None)
+
+        # the votes of the turns are always counted, the packed and hierarchical modes are not implemented
+        if kwargs.get("packed", False) or len(kwargs.get("edge_fan_out", [])) > 0:
+            logging.error("packed_aggregation and edge_fan_out are not supported with take_turns, they are disabled.")
+
+        self.set_current_sign(1)
         self._gatheredGradients = []
+        self._num_gathered = 0
+        self._buffer_empty = True
+
+        # the references of both polarities are packed majority indicators, the clients
+        # count the signs of the opposite polarity, which give the reference of the next turn
         self._plus_sign_buffer = []
         self._minus_sign_buffer = []
-        self._buffer_empty = True
+        self._opposite_counts = []
+
+        # integer mode counts the votes in the narrowest integer type which holds the cohort
+        voteDtype = vote_dtype(kwargs.get("num_clients")) if kwargs.get("int_votes", False) else None
         for group in self.param_groups:
             for param in group["params"]:
-                self._gatheredGradients.append(torch.zeros_like(param))
-                self._plus_sign_buffer.append(torch.zeros_like(param))
-                self._minus_sign_buffer.append(torch.zeros_like(param))
+                self._gatheredGradients.append(torch.zeros_like(param, dtype=voteDtype))
+                self._plus_sign_buffer.append(self.grace.pack_reference(torch.zeros_like(param)))
+                self._minus_sign_buffer.append(self.grace.pack_reference(torch.zeros_like(param)))
+                self._opposite_counts.append(torch.zeros_like(param, dtype=vote_dtype(kwargs.get("num_clients"))))
 
-    def gather(self, **kwargs):
-        """Gather local gradients.
+    def encode(self, **kwargs):
+        """Compress the local gradients of a user, i.e., the user side of `gather`. Besides the codes 
+        of the current polarity, the user reports the packed signs of the opposite polarity.
+
+        Returns:
+            list:  (codes, opposite signs) of every parameter, None where the parameter has no gradient.
         """
-        try:
-            self.turn = kwargs["turn"]
-            self._current_sign = 1 if self.turn%2 == 0 else -1
-        except KeyError:
-            logging.error("Turn trick cannot be applied without 'turn' parameters.")
+        self._set_turn(**kwargs)
 
+        codes = []
         for group in self.param_groups:
             for i, param in enumerate(group['params']):
                 if param.grad is None:
+                    codes.append(None)
                     continue
 
                 # if buffer is empty, encode the gradient
-                if self._buffer_empty:
-                    encodedTensor = self.grace.compress(param.grad.data, sign=self._current_sign)
-                    self._gatheredGradients[i] += self.grace.decompress(encodedTensor, shape=param.grad.data.shape)
-                # if buffer in nonempty, encode the residual
-                elif self.current_sign == 1:
-                    encodedTensor = self.grace.compress_with_reference(param.grad, self._plus_sign_buffer[i])
-                    self._gatheredGradients[i] += self.grace.decompress_with_reference(encodedTensor, self._plus_sign_buffer[i])
-                else:
-                    encodedTensor = self.grace.compress_with_reference(param.grad, self._minus_sign_buffer[i])
-                    self._gatheredGradients[i] += self.grace.decompress_with_reference(encodedTensor, self._minus_sign_buffer[i])
+                with self.profiler.phase("compress"):
+                    if self._buffer_empty:
+                        encodedTensor = self.grace.compress(param.grad.data, sign=self.current_sign)
+                    # if buffer in nonempty, encode the residual
+                    else:
+                        refTensor = self._plus_sign_buffer[i] if self.current_sign == 1 else self._minus_sign_buffer[i]
+                        encodedTensor = self.grace.compress_with_reference(param.grad.data, refTensor, sign=self.current_sign)
 
                 if self.current_sign == 1:
-                    self._minus_sign_buffer[i] += (param.grad.data < -const.EPSILON)
+                    oppositeSigns = pack_bits(param.grad.data < -const.EPSILON)
                 else:
-                    self._plus_sign_buffer[i] += (param.grad.data > const.EPSILON)
+                    oppositeSigns = pack_bits(param.grad.data > const.EPSILON)
+                codes.append((encodedTensor, oppositeSigns))
 
                 # clear the gradients for next step, which is equivalent to zero_grad()
                 param.grad.detach_()
                 param.grad.zero_() 
 
+        return codes
+
+    def receive(self, codes, **kwargs):
+        """Gather the codes of a user returned by `encode`, i.e., the server side of `gather`."""
+        self._set_turn(**kwargs)
+
+        uplinkBits = 0
+        for group in self.param_groups:
+            for i, param in enumerate(group['params']):
+                if codes[i] is None:
+                    continue
+
+                # the packed signs of the opposite polarity are uploaded besides the codes
+                encodedTensor, oppositeSigns = codes[i]
+                uplinkBits += self.grace.payload_bits(encodedTensor) + packed_bits(oppositeSigns)
+                with self.profiler.phase("decompress"):
+                    if self._buffer_empty:
+                        self.grace.accumulate(encodedTensor, self._gatheredGradients[i])
+                    else:
+                        refTensor = self._plus_sign_buffer[i] if self.current_sign == 1 else self._minus_sign_buffer[i]
+                        self.grace.accumulate_with_reference(encodedTensor, refTensor, self._gatheredGradients[i])
+
+                oppositeCounts = self._opposite_counts[i]
+                oppositeCounts.add_(unpack_bits(oppositeSigns, oppositeCounts.numel()).view_as(oppositeCounts))
+
+        self._num_gathered += 1
+        if self.ledger is not None:
+            self.ledger.uplink(kwargs.get("userID"), uplinkBits)
+
+    def _set_turn(self, **kwargs):
+        """Even turns send the "+" signs and odd turns the "-" signs."""
+        try:
+            self.turn = kwargs["turn"]
+            self.set_current_sign(1 if self.turn%2 == 0 else -1)
+        except KeyError:
+            logging.error("Turn trick cannot be applied without 'turn' parameters.")
+
 
     def step(self):
         """Performs a single optimization step.
         """
+        downlinkBits = 0
         for group in self.param_groups:
             for i, param in enumerate(group['params']):
-                d_param = self.grace.trans_aggregation(self._gatheredGradients[i])
-
-                # register buffer
-                if self.current_sign == 1:
-                    self._plus_sign_buffer[i].zero_()
-                    self._minus_sign_buffer[i] = -self.grace.trans_aggregation(self._minus_sign_buffer[i], -self.current_sign)            
-                else:
-                    self._minus_sign_buffer[i].zero_()
-                    self._plus_sign_buffer[i] = self.grace.trans_aggregation(self._plus_sign_buffer[i], -self.current_sign)
+                with self.profiler.phase("aggregation"):
+                    if self._collective is not None:
+                        self._collective.all_reduce(self._gatheredGradients[i])
+                        self._collective.all_reduce(self._opposite_counts[i])
+                    d_param = self.grace.trans_aggregation(self.current_sign * self._gatheredGradients[i], 
+                                    num_clients=self._num_voters())
+
+                # register buffer, the majority of the opposite polarity is the reference of the next turn
+                oppositeBuffer = self._minus_sign_buffer[i] if self.current_sign == 1 else self._plus_sign_buffer[i]
+                self.grace.pack_reference(self.grace.trans_aggregation(self._opposite_counts[i], num_clients=self._num_voters()), 
+                                          out=oppositeBuffer)
+                self._opposite_counts[i].zero_()
                 
                 d_param = self.current_sign * d_param
                 param.data.add_(d_param, alpha=-group["lr"])
                 self._gatheredGradients[i].zero_()
+
+                # the majority signs of the current polarity are broadcast with one bit per coordinate
+                downlinkBits += num_elements(param.shape)
                 
+        self._num_gathered = 0
+        if self.ledger is not None:
+            self.ledger.downlink(downlinkBits)
         self._buffer_empty = False
 
+    def buffer_state_dict(self):
+        """The sign references of both polarities besides the state of the wrapped optimizer."""
+        return dict(plus_sign_buffer=self._plus_sign_buffer, 
+                    minus_sign_buffer=self._minus_sign_buffer,
+                    opposite_counts=self._opposite_counts,
+                    buffer_empty=self._buffer_empty,
+                    current_sign=self.current_sign)
+
+    def load_buffer_state_dict(self, state):
+        """Restore the buffers saved by `buffer_state_dict`."""
+        for buffer, savedBuffer in zip(self._plus_sign_buffer, state["plus_sign_buffer"]):
+            buffer.copy_(savedBuffer)
+        for buffer, savedBuffer in zip(self._minus_sign_buffer, state["minus_sign_buffer"]):
+            buffer.copy_(savedBuffer)
+        for counts, savedCounts in zip(self._opposite_counts, state["opposite_counts"]):
+            counts.copy_(savedCounts)
+        self._buffer_empty = state["buffer_empty"]
+        self.set_current_sign(state["current_sign"])
+
     @property
     def current_sign(self):
         """wrapper of the grace._current_sign"""
@@ -282,6 +663,10 @@ def grace_optimizer(optimizer, grace, **kwargs):
         optimizer (torch.nn.optim.Optimizer):   Optimizer to use for computing gradients and applying updates.
         grace (grace_fl.Compressor):            Compression algorithm used during allreduce to reduce the amount
         mode (int):                             mode represents different implementations of optimizer.
+        flat (bool):                            view the parameters and gradients of each group as one contiguous buffer.
+        int_votes (bool):                       count the votes in int8/int16 counters instead of float32 sums.
+        num_clients (int):                      the largest number of clients gathered in a round, which picks the counter type.
+        collective (VoteCollective):            if set, the votes are joined with the users of the other processes.
     """
     # We dynamically create a new class that inherits from the optimizer that was passed in.
     # The goal is to override the `step()` method.
@@ -292,14 +677,19 @@ def grace_optimizer(optimizer, grace, **kwargs):
     else:
         mode = 3
 
+    # compress, decompress and aggregate once per group on a contiguous buffer
+    if kwargs.get("flat", False):
+        for group in optimizer.param_groups:
+            group["params"] = [FlatParams(group["params"]).param]
+
     if mode==0:
-        cls = type(optimizer.__class__.__name__, (optimizer.__class__,),
+        cls = type(optimizer.__class__.__name__, (_serverMixin, optimizer.__class__),
         dict(_predTurnOptimizer.__dict__))
     elif mode == 1:
-        cls = type(optimizer.__class__.__name__, (optimizer.__class__,),
+        cls = type(optimizer.__class__.__name__, (_serverMixin, optimizer.__class__),
         dict(_predOptimizer.__dict__))
     elif mode == 3:
-        cls = type(optimizer.__class__.__name__, (optimizer.__class__,),
+        cls = type(optimizer.__class__.__name__, (_serverMixin, optimizer.__class__),
             dict(_graceOptimizer.__dict__))
 
     return cls(optimizer.param_groups, grace, **kwargs)
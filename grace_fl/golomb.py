@@ -0,0 +1,100 @@
+"""
+Golomb-Rice coding of the gaps between the 1s of a sparse binary array. The unary quotients
+and the k-bit remainders are kept in two bit streams, so that both directions are vectorized.
+"""
+import numpy as np
+
+# the first byte of a payload holds the Rice parameter k, or PACKED_MODE for plain packed bits,
+# INVERTED_MODE is set with k when the gaps between the 0s of a mostly-1s array are coded
+PACKED_MODE = 255
+INVERTED_MODE = 128
+HEADER_BYTES = 5
+
+def rice_parameter(numel, num_ones):
+    """Rice parameter for geometric gaps with the observed density of 1s."""
+    mean_gap = (numel - num_ones) / num_ones
+    if mean_gap * np.log(2) <= 1:
+        return 0
+    return int(np.round(np.log2(mean_gap * np.log(2))))
+
+def rice_encode(bits):
+    """
+    Encode a flat binary array into a byte array. An array of mostly 1s codes its complement, 
+    and arrays whose Rice code would still be longer than one bit per element, i.e., with a 
+    density near 0.5, are stored as packed bits instead.
+
+    Args,
+        bits (np.ndarray):  the flat binary array.
+
+    Returns:
+        np.ndarray:  uint8 payload with the header, the remainder stream and the unary stream.
+    """
+    numel = bits.shape[0]
+    positions = np.flatnonzero(bits)
+    num_ones = positions.shape[0]
+
+    # the sparser symbol is coded
+    inverted = num_ones > numel // 2
+    if inverted:
+        positions = np.flatnonzero(~bits.astype(bool))
+        num_ones = positions.shape[0]
+
+    header = np.zeros(HEADER_BYTES, dtype=np.uint8)
+    header[0] = INVERTED_MODE if inverted else 0
+    header[1:] = np.asarray([num_ones], dtype="<u4").view(np.uint8)
+    if num_ones == 0:
+        return header
+
+    k = rice_parameter(numel, num_ones)
+    gaps = np.diff(positions, prepend=-1) - 1
+    quotients = gaps >> k
+    coded_bits = int(quotients.sum()) + num_ones*(k + 1)
+    if coded_bits >= numel:
+        header[0] = PACKED_MODE
+        return np.concatenate((header, np.packbits(bits, bitorder="little")))
+
+    # k bits of every remainder, least significant first
+    remainders = (gaps[:, None] >> np.arange(k)) & 1
+    remainder_stream = np.packbits(remainders.flatten().astype(bool), bitorder="little")
+
+    # quotient q is coded as q zeros followed by a 1
+    unary = np.zeros(int(quotients.sum()) + num_ones, dtype=bool)
+    unary[np.cumsum(quotients + 1) - 1] = True
+    unary_stream = np.packbits(unary, bitorder="little")
+
+    header[0] |= k
+    return np.concatenate((header, remainder_stream, unary_stream))
+
+def rice_decode(payload, numel):
+    """
+    Decode a byte array produced by `rice_encode`.
+
+    Args,
+        payload (np.ndarray):   the uint8 payload.
+        numel (int):            the number of encoded elements.
+
+    Returns:
+        np.ndarray:  the flat bool array.
+    """
+    mode = int(payload[0])
+    num_ones = int(payload[1:HEADER_BYTES].view("<u4")[0])
+    if mode == PACKED_MODE:
+        return np.unpackbits(payload[HEADER_BYTES:], count=numel, bitorder="little").astype(bool)
+
+    # the 1s of an inverted payload mark the 0s of the array
+    inverted = (mode & INVERTED_MODE) != 0
+    k = mode & ~INVERTED_MODE
+    bits = np.full(numel, inverted, dtype=bool)
+    if num_ones == 0:
+        return bits
+
+    remainder_bytes = -(-num_ones*k // 8)
+    remainders = np.unpackbits(payload[HEADER_BYTES:HEADER_BYTES+remainder_bytes], count=num_ones*k, bitorder="little")
+    remainders = (remainders.reshape(num_ones, k).astype(np.int64) << np.arange(k)).sum(axis=1)
+
+    unary = np.unpackbits(payload[HEADER_BYTES+remainder_bytes:], bitorder="little")
+    quotients = np.diff(np.flatnonzero(unary)[:num_ones], prepend=-1) - 1
+
+    gaps = (quotients << k) | remainders
+    bits[np.cumsum(gaps + 1) - 1] = not inverted
+    return bits
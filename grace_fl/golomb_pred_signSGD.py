@@ -0,0 +1,16 @@
+# My libraries
+from grace_fl.coded_pred_signSGD import CodedPredSignSGDCompressor
+from grace_fl.golomb import rice_encode, rice_decode, HEADER_BYTES
+
+class GolombPredSignSGDCompressor(CodedPredSignSGDCompressor):
+    """Predictive signSGD whose sparse residuals are coded as gaps between sign flips with 
+    Golomb-Rice codes, the Rice parameter is picked per tensor from the residual density."""
+
+    def encode_bits(self, bits):
+        return rice_encode(bits)
+
+    def decode_bits(self, payload, numel):
+        return rice_decode(payload, numel)
+
+    def header_bytes(self, numel):
+        return HEADER_BYTES
@@ -6,9 +6,12 @@ import torch
 
 # My libraries
 from grace_fl import Compressor
+from grace_fl.packing import pack_bits, unpack_bits, count_bits, num_elements
 import grace_fl.constant as const 
 
 class IdealBinaryPredSignSGDCompressor(Compressor):
+    packed_vote = True
+
     def __init__(self, config):
         super().__init__()
         self.dtype = torch.uint8
@@ -21,53 +24,79 @@ class IdealBinaryPredSignSGDCompressor(Compressor):
 
     def compress(self, tensor):
         """
-        Compress the input tensor with run-length of sign and simulate the saved data volume in bit.
+        Compress the input tensor with its signs packed into words of `self.dtype`.
 
         Args,
             tensor (torch.tensor):  the input tensor.
         """
-        ones_tensor = torch.ones_like(tensor)
-        zeros_tensor = torch.zeros_like(tensor)
-        encodedTensor = torch.where(tensor>0, ones_tensor, zeros_tensor)
+        encodedTensor = pack_bits(tensor>0, dtype=self.dtype)
         return encodedTensor
 
     def compress_with_reference(self, tensor, ref_tensor):
         """
         Given a reference tensor, compress the residual between the input tensor and the reference.
+        The residual marks the coordinates whose sign flips and is packed into words of `self.dtype`.
         An ideal compressor supposes that the ratio is equal to entropy.
 
         Args,
             tensor (torch.tensor):  the input tensor.
-            ref_tensor (torch.tensor): the reference tensor.
+            ref_tensor (torch.tensor): the packed reference signs.
         """
-        ones_tensor = torch.ones_like(tensor)
-        sign_tensor = torch.where(tensor>0, ones_tensor, -ones_tensor)
-        residual = sign_tensor - ref_tensor
-        encodedTensor = residual
+        encodedTensor = pack_bits(tensor>0, dtype=self.dtype) ^ ref_tensor
 
-        self.total_symbols += np.prod(residual.shape)
-        self.residual_symbols += torch.sum(residual != 0).item()
+        self.total_symbols += tensor.numel()
+        self.residual_symbols += count_bits(encodedTensor)
 
         return encodedTensor
 
     def decompress(self, codes, shape):
-        """Decode the tensor codes to float format."""
-        decoded_tensor = codes.to(torch.float32)
+        """Decode the packed tensor codes to float format."""
+        decoded_tensor = unpack_bits(codes, num_elements(shape))
+        decoded_tensor = decoded_tensor.to(torch.float32)
         decoded_tensor = decoded_tensor.view(shape)
         decoded_tensor = 2*decoded_tensor - 1
         return decoded_tensor
 
-    def decompress_with_reference(self, tensor, ref_tensor):
+    def decompress_with_reference(self, tensor, ref_tensor, shape):
         """Decode the tensor given the reference tensor.
         
         Args:
-            tensor (torch.tensor):    the residual tensor.
-            ref_tensor (torch.tensor): the reference tensor.
+            tensor (torch.tensor):    the packed residual tensor.
+            ref_tensor (torch.tensor): the packed reference signs.
+            shape (torch.Size):        the shape of the decoded tensor.
         """
-        decoded_tensor = tensor + ref_tensor
+        decoded_tensor = self._decode_with_reference(tensor, ref_tensor, num_elements(shape))
+        decoded_tensor = decoded_tensor.to(torch.float32)
+        decoded_tensor = decoded_tensor.view(shape)
+        decoded_tensor = 2*decoded_tensor - 1
 
         return decoded_tensor
 
+    def _decode(self, codes, numel):
+        """Unpack the codes into a flat bool tensor."""
+        return unpack_bits(codes, numel)
+
+    def _decode_with_reference(self, codes, ref_tensor, numel):
+        """Flip the packed reference signs where the residual is set and unpack them into a flat bool tensor."""
+        return unpack_bits(codes ^ ref_tensor, numel)
+
+    def accumulate(self, codes, counts):
+        """Add the +1/-1 votes of the signs into the counts in place, i.e., counts += 2*bits - 1."""
+        bits = self._decode(codes, counts.numel()).view(counts.shape)
+        counts.add_(bits, alpha=2).sub_(1)
+
+    def accumulate_with_reference(self, codes, ref_tensor, counts):
+        """Add the +1/-1 votes of the sign flips into the counts in place, a coordinate votes "+" 
+        where it keeps a "+" reference or flips a "-" reference.
+
+        Args:
+            codes (torch.tensor):       the residual codes.
+            ref_tensor (torch.tensor):  the packed reference signs.
+            counts (torch.tensor):      the vote counts.
+        """
+        bits = self._decode_with_reference(codes, ref_tensor, counts.numel()).view(counts.shape)
+        counts.add_(bits, alpha=2).sub_(1)
+
     @property
     def compress_ratio(self):
         """Use the entropy as a compression estimation."""
@@ -83,14 +112,25 @@ class IdealBinaryPredSignSGDCompressor(Compressor):
         self.total_symbols = 0
         self.residual_symbols = 0
 
-    def trans_aggregation(self, tensor):
-        """Transform a raw aggregation sum. 
+    def trans_aggregation(self, tensor, num_clients=None):
+        """Transform a raw aggregation sum, the sign of the +1/-1 votes does not depend on num_clients. 
 
         Args,
             tensor (torch.Tensor): the input aggregation tensor.
+            num_clients (int):     the number of aggregated clients.
         """
 
-        onesTensor = torch.ones_like(tensor)
+        onesTensor = torch.ones_like(tensor, dtype=torch.float32)
         aggedTensor = torch.where(tensor > 0, onesTensor, -onesTensor)
         return aggedTensor
 
+    def vote(self, counts, num_clients):
+        """Majority vote from the counts of "+" signs, ties resolve to "-".
+
+        Args,
+            counts (torch.Tensor): the number of clients with a "+" sign for each coordinate.
+            num_clients (int):     the number of clients.
+        """
+        aggedTensor = (2*counts > num_clients).to(torch.float32)
+        aggedTensor = 2*aggedTensor - 1
+        return aggedTensor
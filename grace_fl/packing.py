@@ -0,0 +1,69 @@
+import numpy as np
+
+# PyTorch Libraries
+import torch
+
+# My libraries
+import grace_fl.constant as const
+
+word_bits = {
+torch.uint8: const.BYTE_BIT,
+torch.int64: const.DOUBLE_WORD_BIT
+}
+
+def pack_bits(tensor, dtype=torch.uint8, out=None):
+    """Pack a binary tensor into words, 8 bits per uint8 or 64 bits per int64.
+    The tensor is flattened and zero padded to a whole number of words.
+
+    Args,
+        tensor (torch.tensor):  the binary (bool or 0/1) input tensor.
+        dtype (torch.dtype):    the word type, torch.uint8 or torch.int64.
+        out (torch.tensor):     if set, the words are written in place into this packed tensor.
+    """
+    bits = (tensor.flatten() != 0)
+    padding = (-bits.numel()) % word_bits[dtype]
+    if padding != 0:
+        bits = torch.cat((bits, bits.new_zeros(padding)))
+
+    # bit b of a byte holds the element 8*i + b
+    bits = bits.view(-1, const.BYTE_BIT).to(torch.uint8)
+    if out is None:
+        packedTensor = bits[:, 0].clone()
+    else:
+        packedTensor = out.view(torch.uint8)
+        packedTensor.copy_(bits[:, 0])
+    for b in range(1, const.BYTE_BIT):
+        packedTensor.bitwise_or_(bits[:, b] << b)
+
+    return packedTensor.view(dtype)
+
+def unpack_bits(tensor, numel):
+    """Unpack words produced by `pack_bits` into a flat bool tensor.
+
+    Args,
+        tensor (torch.tensor):  the packed words.
+        numel (int):            the number of elements before packing.
+    """
+    packedTensor = tensor.flatten().view(torch.uint8)
+    bits = torch.empty((packedTensor.numel(), const.BYTE_BIT), dtype=torch.bool, device=tensor.device)
+    for b in range(const.BYTE_BIT):
+        bits[:, b] = (packedTensor >> b) & 1
+
+    return bits.flatten()[:numel]
+
+def count_bits(tensor):
+    """Number of 1 bits of a packed tensor, the padding bits are zero."""
+    packedTensor = tensor.flatten().view(torch.uint8)
+    count = 0
+    for b in range(const.BYTE_BIT):
+        count += int(((packedTensor >> b) & 1).sum())
+
+    return count
+
+def packed_bits(tensor):
+    """Number of bits actually allocated by a packed tensor."""
+    return tensor.numel() * tensor.element_size() * const.BYTE_BIT
+
+def num_elements(shape):
+    """Number of elements of a tensor with the given shape."""
+    return int(np.prod(shape))
@@ -1,4 +1,3 @@
-import numpy as np
 import logging
 
 # PyTorch Libraries
@@ -6,75 +5,89 @@ import torch
 
 # My libraries
 from grace_fl import Compressor
+from grace_fl.packing import unpack_bits, num_elements
 import grace_fl.constant as const 
 
+def _run_lengths(tensors, thres):
+    """Split the rows of a stacked binary tensor into runs capped at 2**thres - 1.
+
+    Returns the run lengths, the symbols and the number of runs for each row. A run
+    whose length is a multiple of the cap is terminated by an empty run, which 
+    matches the code sequence of the element-wise encoder (thres >= 2).
+    """
+    numClients = tensors.shape[0]
+    symbols = (tensors.reshape(numClients, -1) != 0)
+    numElements = symbols.shape[1]
+    runCap = 2**thres - 1
+    
+    # a run starts at the first element of a row or wherever the symbol changes
+    boundaries = torch.ones_like(symbols)
+    boundaries[:, 1:] = (symbols[:, 1:] != symbols[:, :-1])
+    starts = torch.nonzero(boundaries.flatten()).flatten()
+    ends = torch.cat((starts[1:], starts.new_tensor([symbols.numel()])))
+    runLengths = ends - starts
+    runSymbols = symbols.flatten()[starts].to(torch.int64)
+
+    # split the over-long runs at the cap, the remainder closes the run
+    numFullRuns = torch.div(runLengths, runCap, rounding_mode="floor")
+    numCodes = numFullRuns + 1
+    lastCodes = torch.cumsum(numCodes, dim=0) - 1
+    codedLengths = torch.full((int(lastCodes[-1]) + 1,), runCap, dtype=torch.int64, device=tensors.device)
+    codedLengths[lastCodes] = runLengths - numFullRuns*runCap
+    codedSymbols = torch.repeat_interleave(runSymbols, numCodes)
+
+    rowCodes = torch.zeros(numClients, dtype=torch.int64, device=tensors.device)
+    rowCodes.index_add_(0, torch.div(starts, numElements, rounding_mode="floor"), numCodes)
+
+    return codedLengths, codedSymbols, rowCodes
+
 def rl_enc(tensor, thres=const.NIBBLE_BIT):
     """run-length encoding for a binary tensor. 
     """
-    clonedTensor = tensor.flatten().clone()
-    currSymbol = 0 if clonedTensor[0] == 0 else 1 
-    codedSeqs = []
-    runLength = 0
-    
-    iteration = 0
-    bitThreshold = 2**thres 
-    for element in clonedTensor:
-        iteration += 1
-
-        if element == currSymbol:
-            runLength += 1
-            if runLength >= bitThreshold - 1:
-                codedSeqs.append(runLength)
-                codedSeqs.append(currSymbol)
-
-                runLength = 0
-        else:
-            codedSeqs.append(runLength)
-            codedSeqs.append(currSymbol)
-            
-            runLength = 1
-            currSymbol = 0 if element == 0 else 1 
+    return rl_enc_batch(tensor.unsqueeze(0), thres=thres)[0]
 
-    # Last part of the code sequence
-    codedSeqs.append(runLength)
-    codedSeqs.append(currSymbol)
+def rl_enc_batch(tensors, thres=const.NIBBLE_BIT):
+    """run-length encoding for a stack of binary tensors, one client per row of 
+    the first dimension. Returns a list with the code sequence of each client.
+    """
+    codedLengths, codedSymbols, rowCodes = _run_lengths(tensors, thres)
+    codedSeqs = torch.stack((codedLengths, codedSymbols), dim=1).flatten()
+    codedSeqs = torch.split(codedSeqs, (2*rowCodes).tolist())
     
-    codedSeqs = torch.from_numpy(np.asarray(codedSeqs))
-    codedSeqs = codedSeqs.to(tensor.device)
-    return codedSeqs
+    return list(codedSeqs)
 
 def rl_dec(codedSeqs):
     """run-length decoding from a code sequence. The first element is set to zero by force.
     """
-    
-    decodedTensor = []
-    step = 2
-    symbols = [codedSeqs[i] for i in range(1, len(codedSeqs), step)]
-    runLengths = [codedSeqs[i] for i in range(0, len(codedSeqs), step)]
-    
-    for symbol, runLength in zip(symbols, runLengths):
-        for i in range(runLength):
-            decodedTensor.append(symbol)
-
-    decodedTensor = torch.tensor(decodedTensor)
+    runLengths = codedSeqs[0::2]
+    symbols = codedSeqs[1::2]
+    decodedTensor = torch.repeat_interleave(symbols, runLengths)
     decodedTensor = decodedTensor.to(torch.float32)
-    decodedTensor = decodedTensor.to(codedSeqs.device)
-    decodedTensor = decodedTensor.flatten()
+
+    return decodedTensor
+
+def rl_dec_batch(codedSeqs):
+    """run-length decoding from a list of code sequences with equal decoded length. 
+    Returns a tensor with one decoded client per row.
+    """
+    decodedTensor = rl_dec(torch.cat(codedSeqs))
+    decodedTensor = decodedTensor.view(len(codedSeqs), -1)
 
     return decodedTensor
     
 
 class PredRLESignSGDCompressor(Compressor):
 
-    def __init__(self, thres):
+    def __init__(self, config):
         super().__init__()
         self._const_compress_ratio = False
         self._code_dtype_bit = const.WORD_BIT
-        self.th = thres
+        self.dtype = torch.uint8
+        self.th = int(0.5 * config.users * config.sampling_fraction)
 
-        # total number of symbols (gradient coordinates) & number of residuals
-        self.total_symbols = 0
-        self.residual_symbols = 0
+        # raw bits of the input tensors & bits of the code sequences
+        self.raw_bits = 0
+        self.coded_bits = 0
 
     def compress(self, tensor, sign):
         """
@@ -91,9 +104,8 @@ class PredRLESignSGDCompressor(Compressor):
             
         encodedTensor = rl_enc(signs, thres=self._code_dtype_bit)
 
-        rawBits = torch.prod(torch.tensor(tensor.shape)) * const.FLOAT_BIT
-        codedBits = torch.tensor(len(encodedTensor) * self._code_dtype_bit, dtype=torch.float)
-        self.compress_ratios.append(rawBits/codedBits)
+        self.raw_bits += tensor.numel() * const.FLOAT_BIT
+        self.coded_bits += len(encodedTensor) * self._code_dtype_bit
 
         return encodedTensor
 
@@ -103,10 +115,10 @@ class PredRLESignSGDCompressor(Compressor):
 
         Args,
             tensor (torch.tensor):  the input tensor.
-            refTensor (torch.tensor): the reference tensor.
+            refTensor (torch.tensor): the packed reference signs.
             sign (int):             1 for "+" and -1 for "-"
         """
-
+        refTensor = unpack_bits(refTensor, tensor.numel()).view_as(tensor)
         if sign == 1:
             residual = ((tensor > 0) != refTensor)
         else:
@@ -114,51 +126,60 @@ class PredRLESignSGDCompressor(Compressor):
 
         encodedTensor = rl_enc(residual, thres=self._code_dtype_bit)
 
+        self.raw_bits += tensor.numel() * const.FLOAT_BIT
+        self.coded_bits += len(encodedTensor) * self._code_dtype_bit
+
         return encodedTensor
 
     def decompress(self, codes, shape):
         """Decode the tensor codes to float format."""
         decodedTensor = rl_dec(codes)
         decodedTensor = decodedTensor.view(shape)
-        decodedTensor = decodedTensor
+        decodedTensor = self._current_sign * decodedTensor
         return decodedTensor
 
-    def decompress_with_reference(self, tensor, refTensor):
+    def decompress_with_reference(self, tensor, refTensor, shape):
         """Decode the residual tensor given the reference tensor.
         
         Args:
             tensor (torch.tensor, bool):    the residual tensor.
-            refTensor (torch.tensor, bool): the reference tensor.
+            refTensor (torch.tensor):       the packed reference signs.
+            shape (torch.Size):             the shape of the decoded tensor.
         """
-        decodedTensor = rl_dec(tensor)
-        decodedTensor = decodedTensor.view_as(refTensor)
-        decodedTensor = torch.where(decodedTensor==1,1-refTensor, refTensor)
+        decodedTensor = (rl_dec(tensor) == 1) ^ unpack_bits(refTensor, num_elements(shape))
+        decodedTensor = decodedTensor.view(shape)
         decodedTensor = decodedTensor.to(torch.float32)
+        decodedTensor = self._current_sign * decodedTensor
 
         return decodedTensor
 
     @property
     def compress_ratio(self):
-        """Use the entropy as a compression estimation."""
-        residual_ratio = self.residual_symbols / self.total_symbols
-        entropy = -residual_ratio*np.log2(residual_ratio) - (1-residual_ratio)*np.log2(1-residual_ratio)
+        """Ratio between the raw bits and the bits of the code sequences."""
+        if self.coded_bits == 0:
+            return self._const_compress_ratio
+        return self.raw_bits / self.coded_bits
 
-        return const.FLOAT_BIT/entropy
+    def payload_bits(self, codes):
+        """Every run length and symbol of the code sequence takes a code word."""
+        return len(codes) * self._code_dtype_bit
 
     def reset(self):
-        self.total_symbols = 0
-        self.residual_symbols = 0
+        self.raw_bits = 0
+        self.coded_bits = 0
 
-    def trans_aggregation(self, tensor):
+    def trans_aggregation(self, tensor, num_clients=None):
         """Transform a raw aggregation sum. 
 
         Args,
             tensor (torch.Tensor): the input aggregation tensor.
+            num_clients (int):     the number of aggregated clients, None for the configured cohort.
         """
 
-        onesTensor = torch.ones_like(tensor)
-        zerosTensor = torch.zeros_like(tensor)
-        aggedTensor = torch.where(tensor > self.th, onesTensor, zerosTensor)
+        th = self.th if num_clients is None else int(0.5 * num_clients)
+        onesTensor = torch.ones_like(tensor, dtype=torch.float32)
+        zerosTensor = torch.zeros_like(tensor, dtype=torch.float32)
+        aggedTensor = torch.where(tensor > th, onesTensor, zerosTensor)
         return aggedTensor
 
     def aggregate(self, tensors):
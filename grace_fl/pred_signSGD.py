@@ -6,9 +6,12 @@ import torch
 
 # My libraries
 from grace_fl import Compressor
+from grace_fl.packing import pack_bits, unpack_bits, packed_bits, num_elements
 import grace_fl.constant as const 
 
 class PredSignSGDCompressor(Compressor):
+    packed_vote = True
+
     def __init__(self, config):
         super().__init__()
         self.dtype = torch.uint8
@@ -16,9 +19,13 @@ class PredSignSGDCompressor(Compressor):
         self._const_compress_ratio = False
         self.compress_ratios = []
 
+        # raw bits of the input tensors & bits allocated by the packed signs
+        self.raw_bits = 0
+        self.coded_bits = 0
+
     def compress(self, tensor, sign):
         """
-        Compress the input tensor with run-length of sign and simulate the saved data volume in bit.
+        Compress the input tensor with the signs of one polarity packed into words of `self.dtype`.
 
         Args,
             tensor (torch.tensor):  the input tensor.
@@ -31,58 +38,102 @@ class PredSignSGDCompressor(Compressor):
         else:
             signs = (tensor < -const.EPSILON)
 
-        encodedTensor = signs
+        encodedTensor = self._pack(signs, tensor)
         return encodedTensor
 
     def compress_with_reference(self, tensor, refTensor, sign):
         """
-        Given a reference sign tensor, compress the residual between the input tensor and the reference with run-length encoding.
+        Given a reference sign tensor, compress the residual between the input tensor and the reference with packed bits.
 
         Args,
             tensor (torch.tensor):  the input tensor.
-            refTensor (torch.tensor): the reference tensor.
+            refTensor (torch.tensor): the packed reference signs.
         """
         if sign == 1:
-            residual = ((tensor > const.EPSILON) != refTensor)
+            signs = (tensor > const.EPSILON)
         else:
-            residual = ((tensor < -const.EPSILON) != refTensor) 
+            signs = (tensor < -const.EPSILON)
+
+        encodedTensor = self._pack(signs, tensor) ^ refTensor
+        return encodedTensor
 
-        encodedTensor = residual
+    def _pack(self, bits, tensor):
+        """Pack the bits and account the raw and allocated bits."""
+        encodedTensor = pack_bits(bits, dtype=self.dtype)
+        self.raw_bits += tensor.numel() * const.FLOAT_BIT
+        self.coded_bits += packed_bits(encodedTensor)
         return encodedTensor
 
     def decompress(self, codes, shape):
-        """Decode the tensor codes to float format."""
-        decodedTensor = codes.to(torch.float32)
+        """Decode the packed tensor codes to float format."""
+        decodedTensor = unpack_bits(codes, num_elements(shape))
+        decodedTensor = decodedTensor.to(torch.float32)
         decodedTensor = decodedTensor.view(shape)
         decodedTensor = self._current_sign * decodedTensor
         return decodedTensor
 
-    def decompress_with_reference(self, tensor, refTensor):
+    def decompress_with_reference(self, tensor, refTensor, shape):
         """Decode the residual tensor given the reference tensor.
         
         Args:
-            tensor (torch.tensor):    the residual tensor.
-            refTensor (torch.tensor): the reference tensor.
+            tensor (torch.tensor):    the packed residual tensor.
+            refTensor (torch.tensor): the packed reference signs.
+            shape (torch.Size):       the shape of the decoded tensor.
         """
-        decodedTensor = torch.where(tensor==1, 1-refTensor, refTensor)
-        decodedTensor = decodedTensor.to(torch.float32)
-        decodedTensor = self._current_sign * decodedTensor
+        return self.decompress(tensor ^ refTensor, shape)
 
-        return decodedTensor
+    def accumulate(self, codes, counts):
+        """Add the signs of the current polarity into the counts in place."""
+        bits = unpack_bits(codes, counts.numel()).view(counts.shape)
+        counts.add_(bits, alpha=self._current_sign)
+
+    def accumulate_with_reference(self, codes, refTensor, counts):
+        """Add the signs of the current polarity decoded with the reference into the counts in place.
+
+        Args:
+            codes (torch.tensor):     the packed residual tensor.
+            refTensor (torch.tensor): the packed reference signs.
+            counts (torch.tensor):    the vote counts.
+        """
+        self.accumulate(codes ^ refTensor, counts)
 
     @property
     def compress_ratio(self):
-        return self._const_compress_ratio
+        """Ratio between the raw bits and the bits allocated by the packed signs."""
+        if self.coded_bits == 0:
+            return self._const_compress_ratio
+        return self.raw_bits / self.coded_bits
+
+    def reset(self):
+        self.raw_bits = 0
+        self.coded_bits = 0
 
-    def trans_aggregation(self, tensor):
+    def trans_aggregation(self, tensor, num_clients=None):
         """Transform a raw aggregation sum. 
 
         Args,
             tensor (torch.Tensor): the input aggregation tensor.
+            num_clients (int):     the number of aggregated clients, None for the configured cohort.
         """
 
-        onesTensor = torch.ones_like(tensor)
-        zerosTensor = torch.zeros_like(tensor)
-        aggedTensor = torch.where(tensor > self.majority_thres, onesTensor, zerosTensor)
+        onesTensor = torch.ones_like(tensor, dtype=torch.float32)
+        zerosTensor = torch.zeros_like(tensor, dtype=torch.float32)
+        aggedTensor = torch.where(tensor > self._threshold(num_clients), onesTensor, zerosTensor)
+        return aggedTensor
+
+    def vote(self, counts, num_clients):
+        """Majority vote from the counts of signs of the current polarity.
+
+        Args,
+            counts (torch.Tensor): the number of clients sending the sign for each coordinate.
+            num_clients (int):     the number of clients.
+        """
+        aggedTensor = (counts > self._threshold(num_clients))
+        aggedTensor = aggedTensor.to(torch.float32)
         return aggedTensor
 
+    def _threshold(self, num_clients):
+        """A coordinate is set if more than half of the aggregated clients send its sign."""
+        if num_clients is None:
+            return self.majority_thres
+        return int(0.5 * num_clients)
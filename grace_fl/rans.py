@@ -0,0 +1,114 @@
+"""
+Adaptive binary rANS coder. The symbols are dealt to interleaved lanes which share one
+word stream, so that every coding step is a numpy operation over all the lanes.
+"""
+import numpy as np
+
+# probabilities are quantized to PROB_BITS, the lane states live in [RANS_L, RANS_L << IO_BITS)
+PROB_BITS = 12
+PROB_SCALE = 1 << PROB_BITS
+IO_BITS = 16
+IO_MASK = (1 << IO_BITS) - 1
+RANS_L = 1 << 16
+
+# the model tracks the probability of "1" with EST_BITS and moves 1/2**ADAPT_SHIFT towards each step
+EST_BITS = 16
+ADAPT_SHIFT = 3
+
+# a lane codes at least SYMBOLS_PER_LANE symbols, no more than MAX_LANES lanes are used
+SYMBOLS_PER_LANE = 1024
+MAX_LANES = 1024
+
+def num_lanes(numel):
+    """Number of interleaved lanes for a stream of numel symbols."""
+    return int(np.clip(numel // SYMBOLS_PER_LANE, 1, MAX_LANES))
+
+def state_bytes(numel):
+    """Bytes of the final lane states at the head of a payload, a fixed cost of 4 bytes per lane."""
+    return 4 * num_lanes(numel)
+
+def _adaptive_freqs(ones_per_step, lanes):
+    """Quantized frequency of "1" used at each step, estimated from the previous steps only."""
+    freqs = np.empty(ones_per_step.shape[0], dtype=np.int64)
+    estimate = 1 << (EST_BITS - 1)
+    for t, ones in enumerate(ones_per_step.tolist()):
+        freqs[t] = min(max(estimate >> (EST_BITS - PROB_BITS), 1), PROB_SCALE - 1)
+        estimate += ((ones << EST_BITS) // lanes - estimate) >> ADAPT_SHIFT
+
+    return freqs
+
+def rans_encode(bits):
+    """
+    Encode a flat binary array into a byte array.
+
+    Args,
+        bits (np.ndarray):  the flat binary array.
+
+    Returns:
+        np.ndarray:  uint8 payload with the final lane states followed by the word stream.
+    """
+    numel = bits.shape[0]
+    lanes = num_lanes(numel)
+    steps = -(-numel // lanes)
+    symbols = np.zeros(steps * lanes, dtype=bool)
+    symbols[:numel] = bits
+    symbols = symbols.reshape(steps, lanes)
+    freqs = _adaptive_freqs(symbols.sum(axis=1), lanes)
+
+    # rANS works as a stack: encode backwards so that the decoder runs forwards
+    states = np.full(lanes, RANS_L, dtype=np.int64)
+    chunks = [np.zeros(0, dtype=np.int64)]
+    for t in range(steps - 1, -1, -1):
+        freq_one = freqs[t]
+        freq_zero = PROB_SCALE - freq_one
+        freq = np.where(symbols[t], freq_one, freq_zero)
+        cum = np.where(symbols[t], freq_zero, 0)
+
+        renorm = states >= freq * ((RANS_L >> PROB_BITS) << IO_BITS)
+        chunks.append(states[renorm] & IO_MASK)
+        states[renorm] >>= IO_BITS
+        states = ((states // freq) << PROB_BITS) + states % freq + cum
+
+    words = np.concatenate(chunks[::-1]).astype("<u2")
+    payload = np.concatenate((states.astype("<u4").view(np.uint8), words.view(np.uint8)))
+    return payload
+
+def rans_decode(payload, numel):
+    """
+    Decode a byte array produced by `rans_encode`.
+
+    Args,
+        payload (np.ndarray):   the uint8 payload.
+        numel (int):            the number of encoded symbols.
+
+    Returns:
+        np.ndarray:  the flat bool array.
+    """
+    lanes = num_lanes(numel)
+    steps = -(-numel // lanes)
+    states = payload[:4*lanes].view("<u4").astype(np.int64)
+    words = payload[4*lanes:].view("<u2").astype(np.int64)
+
+    symbols = np.empty((steps, lanes), dtype=bool)
+    estimate = 1 << (EST_BITS - 1)
+    pointer = 0
+    for t in range(steps):
+        freq_one = min(max(estimate >> (EST_BITS - PROB_BITS), 1), PROB_SCALE - 1)
+        freq_zero = PROB_SCALE - freq_one
+
+        slot = states & (PROB_SCALE - 1)
+        symbol = slot >= freq_zero
+        freq = np.where(symbol, freq_one, freq_zero)
+        cum = np.where(symbol, freq_zero, 0)
+        states = freq * (states >> PROB_BITS) + slot - cum
+
+        renorm = states < RANS_L
+        count = int(np.count_nonzero(renorm))
+        states[renorm] = (states[renorm] << IO_BITS) | words[pointer:pointer+count]
+        pointer += count
+
+        symbols[t] = symbol
+        ones = int(np.count_nonzero(symbol))
+        estimate += ((ones << EST_BITS) // lanes - estimate) >> ADAPT_SHIFT
+
+    return symbols.flatten()[:numel]
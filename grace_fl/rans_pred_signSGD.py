@@ -0,0 +1,15 @@
+# My libraries
+from grace_fl.coded_pred_signSGD import CodedPredSignSGDCompressor
+from grace_fl.rans import rans_encode, rans_decode, state_bytes
+
+class RANSPredSignSGDCompressor(CodedPredSignSGDCompressor):
+    """Predictive signSGD whose signs and residuals are entropy coded with an adaptive binary rANS coder."""
+
+    def encode_bits(self, bits):
+        return rans_encode(bits)
+
+    def decode_bits(self, payload, numel):
+        return rans_decode(payload, numel)
+
+    def header_bytes(self, numel):
+        return state_bytes(numel)
@@ -2,34 +2,56 @@ import torch
 
 # My libraries
 from grace_fl import Compressor
+from grace_fl.packing import pack_bits, unpack_bits, packed_bits, num_elements
 import grace_fl.constant as const 
 
 class SignSGDCompressor(Compressor):
+    packed_vote = True
 
     def __init__(self, config):
         super().__init__()
         self.dtype = torch.uint8
         self._const_compress_ratio = const.FLOAT_BIT / const.BINARY_BIT
 
+        # raw bits of the input tensors & bits allocated by the packed signs
+        self.raw_bits = 0
+        self.coded_bits = 0
+
     def compress(self, tensor, **kwargs):
         """
-        Compress the input tensor with signSGD and simulate the saved data volume in bit.
+        Compress the input tensor with signSGD and pack the signs into words of `self.dtype`.
 
         Args,
             tensor (torch.tensor): the input tensor.
         """
-        encodedTensor = (tensor >= 0)
+        encodedTensor = pack_bits(tensor >= 0, dtype=self.dtype)
+
+        self.raw_bits += tensor.numel() * const.FLOAT_BIT
+        self.coded_bits += packed_bits(encodedTensor)
         return encodedTensor
 
     def decompress(self, tensors, shape):
-        """Decode the signs to float format """
-        decodedTensor = tensors.type(torch.float32) * 2 - 1
+        """Decode the packed signs to float format """
+        decodedTensor = unpack_bits(tensors, num_elements(shape))
+        decodedTensor = decodedTensor.type(torch.float32) * 2 - 1
         decodedTensor = decodedTensor.view(shape)
         return decodedTensor
+
+    def accumulate(self, codes, counts):
+        """Add the +1/-1 votes of the packed signs into the counts in place, i.e., counts += 2*bits - 1."""
+        bits = unpack_bits(codes, counts.numel()).view(counts.shape)
+        counts.add_(bits, alpha=2).sub_(1)
     
     @property
     def compress_ratio(self):
-        return self._const_compress_ratio
+        """Ratio between the raw bits and the bits allocated by the packed signs."""
+        if self.coded_bits == 0:
+            return self._const_compress_ratio
+        return self.raw_bits / self.coded_bits
+
+    def reset(self):
+        self.raw_bits = 0
+        self.coded_bits = 0
 
     def trans_aggregation(self, tensor, **kwargs):
         """Transform a raw aggregation sum. 
@@ -37,10 +59,21 @@ class SignSGDCompressor(Compressor):
         Args,
             tensor (torch.Tensor): the input aggregation tensor.
         """
-        onesTensor = torch.ones_like(tensor)
+        onesTensor = torch.ones_like(tensor, dtype=torch.float32)
         aggedTensor = torch.where(tensor >=0, onesTensor, -onesTensor)
         return aggedTensor
 
+    def vote(self, counts, num_clients):
+        """Majority vote from the counts of "+" signs, ties resolve to "+".
+
+        Args,
+            counts (torch.Tensor): the number of clients with a "+" sign for each coordinate.
+            num_clients (int):     the number of clients.
+        """
+        aggedTensor = (2*counts >= num_clients).to(torch.float32)
+        aggedTensor = 2*aggedTensor - 1
+        return aggedTensor
+
     def aggregate(self, tensors):
         """Aggregate a list of tensors.
         
@@ -1,20 +1,29 @@
 import  os
+import random
 import pickle
 import logging
+import argparse
 import numpy as np
 
 # PyTorch libraries
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader
+import torch.distributed as dist
+import torch.multiprocessing as mp
 
 # My libraries
 from config import load_config
 from deeplearning import nn_registry
 from grace_fl import compressor_registry
-from grace_fl.gc_optimizer import signSGD, grace_optimizer, LocalUpdater
-from deeplearning.dataset import UserDataset, assign_user_data, assign_user_resource
+from grace_fl.gc_optimizer import signSGD, grace_optimizer, LocalUpdater, BatchLocalUpdater
+from deeplearning.dataset import assign_user_data, assign_user_resource, assign_cohort_resource
+from deeplearning.evaluator import StreamingEvaluator
+from utils import RoundProfiler, CommLedger, CheckpointWriter, load_checkpoint, rng_state, load_rng_state
+from utils import MetricsWriter
+from utils.async_scheduler import AsyncRoundScheduler
+from utils.client_pool import ClientPool
+from utils.collective import VoteCollective
 
 def init_logger(config):
     """Initialize a logger object. 
@@ -51,44 +60,15 @@ def save_record(file_path, record):
     with open(os.path.join(current_path, file_path), "wb") as fp:
         pickle.dump(record, fp)
 
-def test_accuracy(model, test_dataset, device="cuda"):
-    
-    server_dataset = UserDataset(test_dataset["images"], test_dataset["labels"])
-    num_samples = test_dataset["labels"].shape[0]
-
-    # Full Batch testing
-    testing_data_loader = DataLoader(dataset=server_dataset, batch_size=len(server_dataset))
-    for samples in testing_data_loader:
-        results = model(samples["image"].to(device))
-    
-    predicted_labels = torch.argmax(results, dim=1).detach().cpu().numpy()
-    accuracy = np.sum(predicted_labels == test_dataset["labels"]) / num_samples
-
-    return accuracy
-
-def train_accuracy(model, train_dataset, device="cuda"):
-
-    server_dataset = UserDataset(train_dataset["images"], train_dataset["labels"])
-    num_samples = train_dataset["labels"].shape[0]
-
-    # Full Batch testing
-    training_data_loader = DataLoader(dataset=server_dataset, batch_size=len(server_dataset))
-    for samples in training_data_loader:
-        results = model(samples["image"].to(device))
-    
-    predicted_labels = torch.argmax(results, dim=1).detach().cpu().numpy()
-    accuracy = np.sum(predicted_labels == train_dataset["labels"]) / num_samples
-
-    return accuracy
-
 def count_parameters(model):
     return sum(p.numel() for p in model.parameters() if p.requires_grad)
 
-def train(config, logger, record):
+def train(config, logger, record, checkpoint=None):
     """Simulate Federated Learning training process. 
     
     Args:
         config (object class)
+        checkpoint (dict):      if set, resume the training state saved by a checkpoint.
     """
     # initialize the model
     sample_size = config.sample_size[0] * config.sample_size[1]
@@ -105,75 +85,327 @@ def train(config, logger, record):
     record["compress_ratio"] = []
     record["testing_accuracy"] = []
 
+    # spread the users of a round across the processes of the gloo group
+    collective = None
+    if config.dist_processes > 0:
+        collective = VoteCollective()
+        if config.async_rounds or config.comm_ledger or config.checkpoint_iters > 0 \
+            or config.client_workers > 0 or config.batched_users:
+            logging.error("async_rounds, comm_ledger, checkpoints, client_workers and batched_users "
+                          "are not supported with dist_processes, they are disabled.")
+            config.async_rounds = config.comm_ledger = config.batched_users = False
+            config.checkpoint_iters = config.client_workers = 0
+        record["collective"] = []
+
     # initialize userIDs
     if config.random_sampling:
         users_to_sample = int(config.users * config.sampling_fraction)
         userIDs = np.arange(config.users) 
 
+    # time the phases of the rounds if profiling is enabled
+    profiler = RoundProfiler(enabled=config.profile, device=config.device, 
+                    synchronize=config.profile_sync, trace_dir=config.profile_trace_dir, 
+                    trace_rounds=config.profile_trace_rounds)
+
+    # account the communication of the clients and simulate the wall-clock time of the rounds
+    ledger = None
+    if config.comm_ledger or config.async_rounds:
+        ledger = CommLedger(config.users, uplink_mbps=config.uplink_mbps, downlink_mbps=config.downlink_mbps,
+                            latency_ms=config.latency_ms, sigma=config.bandwidth_sigma, seed=config.network_seed)
+        record["comm"] = []
+        record["sim_time"] = []
+
+    # clients run as coroutines on a virtual clock and the server aggregates a quorum of arrivals
+    if config.async_rounds:
+        scheduler = AsyncRoundScheduler(config, ledger, record["num_parameters"])
+        record["async"] = []
+
     # initialize the optimizer for the server model
     optimizer = optim.SGD(params=classifier.parameters(), lr=config.lr, momentum=config.momentum)
     grace = compressor_registry[config.compressor](config)
-    optimizer = grace_optimizer(optimizer, grace, mode=mode) # wrap the optimizer
+    num_clients = scheduler.quorum if config.async_rounds else int(config.users * config.sampling_fraction)
+    optimizer = grace_optimizer(optimizer, grace, mode=mode, packed=config.packed_aggregation, 
+                                flat=config.flat_params, profiler=profiler, ledger=ledger, 
+                                int_votes=config.int_votes or collective is not None, num_clients=num_clients, 
+                                edge_fan_out=config.edge_fan_out, edge_reduce=config.edge_reduce, 
+                                edge_workers=config.edge_workers, collective=collective) # wrap the optimizer
     criterion = nn.CrossEntropyLoss()
 
     dataset = assign_user_data(config)
+    if config.device_data:
+        train_data, test_data = dataset["train_store"], dataset["test_store"]
+    else:
+        train_data, test_data = dataset["train_data"], dataset["test_data"]
     iterations_per_epoch = np.ceil((dataset["train_data"]["images"].shape[0] * config.sampling_fraction) / config.local_batch_size)
-    iterations_per_epoch = iterations_per_epoch.astype(np.int)
+    iterations_per_epoch = iterations_per_epoch.astype(int)
+
+    # stream the test set in chunks, optionally check a fixed subset every eval_iters iterations
+    test_evaluator = StreamingEvaluator(test_data, batch_size=config.eval_batch_size, device=config.device)
+    if config.eval_iters > 0:
+        record["quick_accuracy"] = []
+        quick_evaluator = StreamingEvaluator(test_data, batch_size=config.eval_batch_size, 
+                                device=config.device, num_samples=config.quick_eval_samples)
     
+    # stream the metrics of every round and epoch to an append-only log
+    metrics = None
+    if config.metrics_log and (collective is None or collective.rank == 0):
+        metrics = MetricsWriter(config.metrics_log, flush_every=config.metrics_flush)
+
     global_turn = -1
     break_flag = False
     comm_rounds = 0
-
-    for epoch in range(config.epoch):
+    start_epoch, start_iteration = 0, 0
+
+    # periodically write the full training state, in-flight async clients cannot be saved
+    checkpoint_writer = None
+    if config.checkpoint_iters > 0:
+        if config.async_rounds:
+            logging.error("Checkpoints are not supported with async_rounds.")
+        else:
+            checkpoint_writer = CheckpointWriter(config.checkpoint_path)
+
+    if checkpoint is not None:
+        classifier.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        optimizer.load_buffer_state_dict(checkpoint["optimizer_buffers"])
+        optimizer.grace.load_state_dict(checkpoint["compressor"])
+        dataset["user_with_data"].load_state_dict(checkpoint["user_sampler"])
+        if config.random_sampling:
+            userIDs[:] = checkpoint["userIDs"]
+        if config.eval_iters > 0:
+            quick_evaluator.sampleIDs = checkpoint["quick_eval_sampleIDs"]
+        if ledger is not None:
+            vars(ledger).update(checkpoint["ledger"])
+        record.update(checkpoint["record"])
+
+        start_epoch, start_iteration = checkpoint["epoch"], checkpoint["iteration"]
+        global_turn, comm_rounds = checkpoint["global_turn"], checkpoint["comm_rounds"]
+        load_rng_state(checkpoint["rng"])
+        logger.info("resume from epoch {:02d} iteration {:d}".format(start_epoch, start_iteration))
+
+    # run the users of a round in worker processes which share the model with the server
+    client_pool = None
+    if config.client_workers > 0:
+        if config.async_rounds or config.device != "cpu":
+            logging.error("The client pool is only supported in synchronous rounds on the cpu.")
+        else:
+            client_pool = ClientPool(config, classifier, optimizer, train_data, 
+                                     config.client_workers, threads=config.client_threads)
+
+    for epoch in range(start_epoch, config.epoch):
         logger.info("epoch {:02d}".format(epoch))
         
-        for iteration in range(iterations_per_epoch):
+        for iteration in range(start_iteration if epoch == start_epoch else 0, iterations_per_epoch):
             global_turn += 1
-            # sample a fraction of users randomly
-            if config.random_sampling:
-                np.random.shuffle(userIDs)
-                userIDs_candidates = userIDs[:users_to_sample]
-
-            # Wait for all users aggregating gradients
-            for userID in userIDs_candidates:
-                user_resource = assign_user_resource(config, userID, 
-                                    dataset["train_data"],  
-                                    dataset["user_with_data"]
-                                )
-
-                updater = LocalUpdater(user_resource)
-                updater.local_step(classifier, optimizer, turn=global_turn)
-            
-            optimizer.step()
+            with profiler.phase("round"):
+                # the scheduler samples the idle users, aggregates a quorum of arrivals and updates the model
+                if config.async_rounds:
+                    numUpdates = scheduler.run_round(classifier, optimizer, train_data, 
+                                    dataset["user_with_data"], global_turn, profiler)
+                else:
+                    # sample a fraction of users randomly
+                    if config.random_sampling:
+                        np.random.shuffle(userIDs)
+                        userIDs_candidates = userIDs[:users_to_sample]
+                    numUpdates = len(userIDs_candidates)
+
+                    # Wait for all users aggregating gradients
+                    if client_pool is not None:
+                        with profiler.phase("clients"):
+                            client_pool.run_round(userIDs_candidates, dataset["user_with_data"], global_turn)
+                    elif config.batched_users:
+                        with profiler.phase("assign_resource"):
+                            cohort_resource = assign_cohort_resource(config, userIDs_candidates, 
+                                                train_data,  
+                                                dataset["user_with_data"]
+                                            )
+
+                            updater = BatchLocalUpdater(cohort_resource, config.user_chunk_size)
+                        updater.local_step(classifier, optimizer, turn=global_turn)
+                    else:
+                        for k, userID in enumerate(userIDs_candidates):
+                            # the batches of the users of the other processes are drawn to keep the samplers in step
+                            if collective is not None and not collective.owns(k, len(userIDs_candidates)):
+                                dataset["user_with_data"].next_batch(userID, config.local_batch_size)
+                                continue
+
+                            with profiler.phase("assign_resource"):
+                                user_resource = assign_user_resource(config, userID, 
+                                                    train_data,  
+                                                    dataset["user_with_data"]
+                                                )
+
+                                updater = LocalUpdater(user_resource)
+                            updater.local_step(classifier, optimizer, turn=global_turn, userID=userID)
+                    
+                    with profiler.phase("step"):
+                        optimizer.step()
+
+                    if ledger is not None:
+                        ledger.close_round()
+                    if collective is not None:
+                        collective.close_round()
+
+            profiler.count("rounds")
+            profiler.count("clients", numUpdates)
+            profiler.step()
+
+            roundMetrics = dict(turn=global_turn, epoch=epoch, clients=numUpdates)
+            if ledger is not None:
+                roundMetrics.update(uplink_bytes=ledger.rounds[-1]["uplink_bytes"].sum(),
+                                    downlink_bytes=ledger.rounds[-1]["downlink_bytes"],
+                                    latency=ledger.rounds[-1]["latency"],
+                                    sim_time=ledger.sim_time)
+            if collective is not None:
+                roundMetrics.update(collective_bytes=collective.rounds[-1]["bytes"], 
+                                    collective_time=collective.rounds[-1]["time"])
+
+            if config.eval_iters > 0 and (global_turn + 1) % config.eval_iters == 0:
+                quickAcc = quick_evaluator.accuracy(classifier)
+                record["quick_accuracy"].append((global_turn, quickAcc))
+                logger.info("iteration {:d} quick test accuracy {:.4f}".format(global_turn, quickAcc))
+                roundMetrics["quick_accuracy"] = quickAcc
+
+            if metrics is not None:
+                metrics.write("round", **roundMetrics)
+
+            if checkpoint_writer is not None and (global_turn + 1) % config.checkpoint_iters == 0:
+                checkpoint_writer.save(dict(
+                    model=classifier.state_dict(),
+                    optimizer=optimizer.state_dict(),
+                    optimizer_buffers=optimizer.buffer_state_dict(),
+                    compressor=optimizer.grace.state_dict(),
+                    user_sampler=dataset["user_with_data"].state_dict(),
+                    userIDs=userIDs if config.random_sampling else None,
+                    quick_eval_sampleIDs=quick_evaluator.sampleIDs if config.eval_iters > 0 else None,
+                    ledger=vars(ledger) if ledger is not None else None,
+                    record=record,
+                    epoch=epoch, iteration=iteration + 1,
+                    global_turn=global_turn, comm_rounds=comm_rounds,
+                    rng=rng_state()
+                ))
 
         with torch.no_grad():
 
             # validate the model and log test accuracy
-            testAcc = test_accuracy(classifier, dataset["test_data"], device=config.device)
+            testAcc = test_evaluator.accuracy(classifier)
             record["testing_accuracy"].append(testAcc)
             logger.info("Test accuracy {:.4f}".format(testAcc))
+            if ledger is not None:
+                record["comm"].append(ledger.summary(ledger.rounds[-iterations_per_epoch:]))
+                record["sim_time"].append(ledger.sim_time)
+                logger.info("uplink {:.3f} MB, downlink {:.3f} MB, simulated time {:.2f}s".format(
+                    record["comm"][-1]["uplink_bytes"]/1e6, record["comm"][-1]["downlink_bytes"]/1e6, ledger.sim_time))
+            if config.async_rounds:
+                record["async"].append(scheduler.summary(iterations_per_epoch))
+                logger.info("{:.1f} rounds/hour, mean staleness {:.3f}, {:d} dropped updates".format(
+                    record["async"][-1]["rounds_per_hour"], record["async"][-1]["mean_staleness"], 
+                    record["async"][-1]["dropped_updates"]))
             comm_rounds += 1
             # comm_rounds += iterations_per_epoch
 
+            if metrics is not None:
+                metrics.write("epoch", epoch=epoch, testing_accuracy=testAcc, 
+                    comm=record["comm"][-1] if ledger is not None else {},
+                    asynchronous=record["async"][-1] if config.async_rounds else {})
+                metrics.flush()
+
             if testAcc > config.performance_threshold:
+                if ledger is not None:
+                    record["time_to_accuracy"] = ledger.sim_time
                 break_flag = True
                 break
 
+        if collective is not None:
+            collective.reduce_counters(optimizer.grace)
+            record["collective"].append(collective.summary(iterations_per_epoch))
+            logger.info("collectives {:.3f} MB, {:.4f}s per round".format(
+                record["collective"][-1]["bytes_per_round"]/1e6, record["collective"][-1]["time_per_round"]))
         record["compress_ratio"].append(optimizer.grace.compress_ratio)
         logger.info("compression ratio: {:.4f}".format(record["compress_ratio"][-1]))
+        if hasattr(optimizer.grace, "ideal_compress_ratio"):
+            record.setdefault("ideal_compress_ratio", []).append(optimizer.grace.ideal_compress_ratio)
+            logger.info("ideal compression ratio: {:.4f}".format(record["ideal_compress_ratio"][-1]))
+        if hasattr(optimizer.grace, "header_overhead"):
+            record.setdefault("header_overhead", []).append(optimizer.grace.header_overhead)
+            logger.info("header overhead: {:.2%} of the coded bits".format(record["header_overhead"][-1]))
         optimizer.grace.reset()
 
+        if profiler.enabled:
+            record.setdefault("profile", []).append(profiler.summary())
+            profiler.log_summary(logger, record["profile"][-1])
+            profiler.reset()
+
+        if metrics is not None:
+            metrics.write("epoch", epoch=epoch, compress_ratio=record["compress_ratio"][-1],
+                ideal_compress_ratio=record["ideal_compress_ratio"][-1] if "ideal_compress_ratio" in record else {},
+                header_overhead=record["header_overhead"][-1] if "header_overhead" in record else {},
+                profile=record["profile"][-1] if profiler.enabled else {})
+            metrics.flush()
+
         if break_flag == True:
             logger.info("Total rounds {:d}".format(comm_rounds))
             record["comm_rounds"] = comm_rounds
             break
 
+    profiler.stop()
+    optimizer.close()
+    if metrics is not None:
+        metrics.close()
+    if checkpoint_writer is not None:
+        checkpoint_writer.close()
+    if config.async_rounds:
+        scheduler.close()
+    if client_pool is not None:
+        client_pool.close()
+    if ledger is not None:
+        record["uplink_bytes_per_user"] = ledger.uplink_total
+        record["downlink_bytes_per_user"] = ledger.downlink_total
+
+def train_rank(rank, overrides=None, resume=""):
+    """Train in one process of a gloo group on localhost. Every process draws the same model and
+    cohorts from the shared seed, runs its slice of the users and joins the votes by collectives.
+    """
+    config = load_config(overrides)
+    dist.init_process_group("gloo", init_method=config.dist_init_method, 
+                            rank=rank, world_size=config.dist_processes)
+    torch.set_num_threads(config.client_threads)
+    random.seed(config.dist_seed)
+    np.random.seed(config.dist_seed)
+    torch.manual_seed(config.dist_seed)
+
+    # the first process logs and saves the record
+    if rank != 0:
+        config.log_level = "WARNING"
+    logger = init_logger(config)
+    if int(config.users * config.sampling_fraction) < config.dist_processes:
+        logging.error("Every process needs at least one user of the cohort.")
+        dist.destroy_process_group()
+        return
+
+    record = {}
+    checkpoint = load_checkpoint(resume) if resume else None
+    train(config, logger, record, checkpoint)
+    if rank == 0 and config.save_record:
+        save_record(config.record_dir, record)
+    dist.destroy_process_group()
+
 def main():
+    parser = argparse.ArgumentParser(description="Simulate federated learning with compressed sign updates.")
+    parser.add_argument("--resume", default="", help="a checkpoint to resume the training from")
+    args = parser.parse_args()
+
     config = load_config()
+    if config.dist_processes > 0:
+        mp.spawn(train_rank, args=(None, args.resume), nprocs=config.dist_processes)
+        return
+
     logger = init_logger(config)
     record = {}
-    train(config, logger, record)
-    save_record(config.record_dir, record)
+    checkpoint = load_checkpoint(args.resume) if args.resume else None
+    train(config, logger, record, checkpoint)
+    if config.save_record:
+        save_record(config.record_dir, record)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import argparse
+import itertools
+import queue
+import tempfile
+import multiprocessing as mp
+import yaml
+import numpy as np
+
+# PyTorch libraries
+import torch
+
+# My libraries
+from config import load_config
+from deeplearning.mmap_dataset import convert_dataset
+from utils import format_table
+import main
+
+def parse_value(text):
+    """Parse a value of the command line as yaml, with the floats yaml 1.1 keeps as strings, e.g., 1e-3."""
+    value = yaml.safe_load(text)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return value
+
+def grid_overrides(items):
+    """Expand ["key=v1,v2", ...] into the cartesian product of the overrides."""
+    keys, choices = [], []
+    for item in items:
+        key, values = item.split("=", 1)
+        keys.append(key)
+        choices.append([parse_value(value) for value in values.split(",")])
+
+    return [dict(zip(keys, values)) for values in itertools.product(*choices)]
+
+def share_dataset(config, shared_dir):
+    """Convert the pickled datasets once into .npy files which every run opens with memory maps,
+    so the workers share the pages instead of each unpickling its own copy.
+
+    Returns:
+        dict:  the overrides which point the runs to the shared datasets.
+    """
+    if config.mmap_data:
+        return {}
+
+    trainDir = os.path.join(shared_dir, "train")
+    testDir = os.path.join(shared_dir, "test")
+    convert_dataset(config.train_data_dir, trainDir)
+    convert_dataset(config.test_data_dir, testDir)
+    return dict(mmap_data=True, train_data_dir=trainDir, test_data_dir=testDir)
+
+def run(job):
+    """Train with one set of overrides in a worker process and summarize the record."""
+    index, overrides, sweptKeys, seed, threads, output_dir = job
+    torch.set_num_threads(threads)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    config = load_config(overrides)
+    config.log_file = os.path.join(output_dir, "run_{:03d}.log".format(index))
+    config.record_dir = os.path.abspath(os.path.join(output_dir, "run_{:03d}.dat".format(index)))
+    logger = main.init_logger(config)
+    logger.info("sweep run {:d}: {:s}".format(index, str(overrides)))
+
+    result = dict(run=index)
+    result.update({key: overrides.get(key, getattr(config, key, None)) for key in sweptKeys})
+
+    # a failing run is reported in the table instead of stopping the sweep
+    record = dict(testing_accuracy=[], compress_ratio=[])
+    start = time.time()
+    try:
+        main.train(config, logger, record)
+    except Exception as error:
+        logger.exception("sweep run {:d} failed".format(index))
+        result["error"] = repr(error)
+    if config.save_record:
+        main.save_record(config.record_dir, record)
+
+    result["final_accuracy"] = record["testing_accuracy"][-1] if record["testing_accuracy"] else float("nan")
+    result["best_accuracy"] = max(record["testing_accuracy"], default=float("nan"))
+    result["epochs"] = len(record["testing_accuracy"])
+    # the compressors report False while they have no measured ratio
+    compressRatio = record["compress_ratio"][-1] if record["compress_ratio"] else False
+    result["compress_ratio"] = float("nan") if isinstance(compressRatio, bool) else float(compressRatio)
+    result["time_to_accuracy"] = record.get("time_to_accuracy", float("nan"))
+    result["wall_time"] = time.time() - start
+    return result
+
+def _run_process(job, results):
+    """Run a job in its own process and send back the summary."""
+    results.put(run(job))
+
+def run_jobs(jobs, workers):
+    """Run every job in a fresh non-daemonic process, at most `workers` at a time. Unlike the daemonic 
+    workers of a Pool, a run may start processes itself, e.g., the client pool of client_workers. 
+
+    Yields:
+        dict:  the summary of every run in the order they finish.
+    """
+    context = mp.get_context("spawn")
+    results = context.Queue()
+    pending = list(jobs)
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            job = pending.pop(0)
+            running[job[0]] = context.Process(target=_run_process, args=(job, results))
+            running[job[0]].start()
+
+        try:
+            result = results.get(timeout=1.)
+        except queue.Empty:
+            # a process which dies without a summary is reported as a failed run
+            for index, process in list(running.items()):
+                if process.exitcode is not None and process.exitcode != 0:
+                    running.pop(index)
+                    yield dict(run=index, error="exit code {:d}".format(process.exitcode))
+            continue
+
+        running.pop(result["run"]).join()
+        yield result
+
+def main_sweep():
+    parser = argparse.ArgumentParser(description="Run a sweep of configuration overrides on a process pool.")
+    parser.add_argument("--grid", nargs="+", default=[], help="key=v1,v2 items whose cartesian product is swept")
+    parser.add_argument("--runs", default="", help="a yaml file with a list of override dicts, each combined with the grid")
+    parser.add_argument("--set", nargs="+", default=[], help="key=value overrides shared by all runs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--threads", type=int, default=1, help="torch threads per worker")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of every run")
+    parser.add_argument("--output-dir", default="./sweep", help="the directory of the logs, records and results")
+    args = parser.parse_args()
+
+    shared = dict(item.split("=", 1) for item in args.set)
+    shared = {key: parse_value(value) for key, value in shared.items()}
+    runs = [{}]
+    if args.runs:
+        with open(args.runs, "r") as fp:
+            runs = yaml.safe_load(fp)
+    grid = grid_overrides(args.grid)
+
+    jobs = []
+    sweptKeys = sorted(set(key for overrides in runs for key in overrides) | set(key for overrides in grid for key in overrides))
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    # the gloo processes of a run need their own launcher and rendezvous
+    for runOverrides, gridOverrides in itertools.product(runs, grid):
+        if load_config(dict(shared, **runOverrides, **gridOverrides)).dist_processes > 0:
+            parser.error("dist_processes is not supported in a sweep, run `python main.py` instead.")
+
+    config = load_config(shared)
+    with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as sharedDir:
+        shared.update(share_dataset(config, sharedDir))
+        for runOverrides, gridOverrides in itertools.product(runs, grid):
+            overrides = dict(shared)
+            overrides.update(runOverrides)
+            overrides.update(gridOverrides)
+            jobs.append((len(jobs), overrides, sweptKeys, args.seed, args.threads, args.output_dir))
+
+        # a fresh process per run keeps the loggers and the peak memory of the runs apart
+        results = []
+        for result in run_jobs(jobs, min(args.workers, len(jobs))):
+            results.append(result)
+            if "error" in result:
+                print("run {:d} failed: {:s}".format(result["run"], result["error"]), flush=True)
+            else:
+                print("run {:d} done, final accuracy {:.4f}".format(result["run"], result["final_accuracy"]), flush=True)
+
+    results.sort(key=lambda result: result["run"])
+    columns = ["run"] + sweptKeys + ["final_accuracy", "best_accuracy", "epochs", "compress_ratio",
+                                     "time_to_accuracy", "wall_time"]
+    if any("error" in result for result in results):
+        columns.append("error")
+    print(format_table(results, columns))
+    with open(os.path.join(args.output_dir, "results.json"), "w") as fp:
+        json.dump(results, fp, indent=2)
+
+if __name__ == "__main__":
+    main_sweep()
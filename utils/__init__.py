@@ -0,0 +1,5 @@
+from .profiler import RoundProfiler
+from .ledger import CommLedger
+from .checkpoint import CheckpointWriter, load_checkpoint, rng_state, load_rng_state
+from .metrics import MetricsWriter, load_metrics
+from .table import format_table
@@ -0,0 +1,195 @@
+import asyncio
+import selectors
+import numpy as np
+
+# My libraries
+import grace_fl.constant as const
+from deeplearning.dataset import assign_user_resource
+from grace_fl.gc_optimizer import LocalUpdater
+from utils.profiler import RoundProfiler
+
+class _VirtualSelector(selectors.BaseSelector):
+    """A selector without file objects which advances the virtual clock of its loop instead of blocking."""
+    def __init__(self):
+        self.loop = None
+        self._map = {}
+
+    def register(self, fileobj, events, data=None):
+        key = selectors.SelectorKey(fileobj, fileobj if isinstance(fileobj, int) else fileobj.fileno(), events, data)
+        self._map[fileobj] = key
+        return key
+
+    def unregister(self, fileobj):
+        return self._map.pop(fileobj)
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("The simulation waits for an event which is never scheduled.")
+        self.loop.virtual_time += timeout
+        return []
+
+    def get_map(self):
+        return self._map
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """An event loop whose clock only moves when every coroutine sleeps, so simulated delays cost no wall time."""
+    def __init__(self):
+        self.virtual_time = 0.
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+
+    def time(self):
+        return self.virtual_time
+
+class _GradientStash(object):
+    """Stand-in optimizer for LocalUpdater which keeps a copy of the local gradients instead of compressing them."""
+    def __init__(self, params):
+        self.params = list(params)
+        self.profiler = RoundProfiler()
+        self.grads = None
+
+    def gather(self, **kwargs):
+        self.grads = [param.grad.detach().clone() for param in self.params]
+        for param in self.params:
+            param.grad.zero_()
+
+class AsyncRoundScheduler(object):
+    def __init__(self, config, ledger, num_params):
+        """Simulate rounds whose clients are asyncio coroutines on a virtual clock. A client receives the
+        broadcast, computes and uploads after simulated delays, and the server aggregates the first
+        `quorum` arrivals or whatever arrived by the deadline. Late updates arrive in later rounds, tagged
+        with their staleness, and are aggregated unless they are older than `max_staleness` rounds.
+
+        The local gradient is computed on the model the client received, and it is compressed when the
+        server accepts it, so a late update votes with the signs of a stale gradient.
+
+        Args:
+            config (class):         a configuration class with the async_* and compute_* settings.
+            ledger (CommLedger):    the network of the clients and the accounting of the payloads.
+            num_params (int):       number of model parameters, the payload is one bit per parameter
+                                    until the first updates are accounted.
+        """
+        self.config = config
+        self.ledger = ledger
+        self.loop = VirtualClockLoop()
+        self.queue = asyncio.Queue()
+
+        self.cohort_size = int(config.users * config.sampling_fraction)
+        self.num_sampled = min(int(np.ceil(self.cohort_size * config.async_overselect)), config.users)
+        self.quorum = max(int(np.ceil(self.cohort_size * config.async_quorum)), 1)
+        self.deadline = config.async_deadline_ms * 1e-3 if config.async_deadline_ms > 0 else None
+        self.max_staleness = config.async_max_staleness
+
+        # each client computes a local step in a fixed log-normal time around compute_ms
+        rng = np.random.default_rng(config.network_seed + 1)
+        self.compute_time = config.compute_ms * 1e-3 * rng.lognormal(0, config.compute_sigma, config.users)
+
+        self.busy = np.zeros(config.users, dtype=bool)
+        self.in_flight = 0
+        self.payload_bytes = num_params / const.BYTE_BIT
+        self.version = 0
+        self.round_times = []
+        self.staleness = []
+        self.dropped = 0
+
+    async def _client(self, userID, grads, version, downlinkBytes):
+        """Deliver the update of a client after its download, compute and upload delays."""
+        delay = (2*self.ledger.latency[userID] + self.compute_time[userID]
+                 + downlinkBytes * const.BYTE_BIT / self.ledger.downlink_bps[userID]
+                 + self.payload_bytes * const.BYTE_BIT / self.ledger.uplink_bps[userID])
+        await asyncio.sleep(delay)
+        self.in_flight -= 1
+        self.queue.put_nowait((userID, grads, version))
+
+    async def _collect(self):
+        """Wait for the quorum or the deadline, and for at least one update."""
+        arrivals = []
+        deadline = None if self.deadline is None else self.loop.time() + self.deadline
+        while len(arrivals) < self.quorum and (self.in_flight > 0 or not self.queue.empty()):
+            timeout = None
+            if deadline is not None and len(arrivals) > 0:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+            try:
+                arrivals.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return arrivals
+
+    def run_round(self, model, optimizer, train_data, user_with_data, turn, profiler):
+        """Run one round: start the sampled idle clients, aggregate the arrivals and update the model.
+
+        Returns:
+            int:  the number of aggregated updates.
+        """
+        start = self.loop.time()
+        stash = _GradientStash(model.parameters())
+        downlinkBytes = self.ledger.rounds[-1]["downlink_bytes"] if self.ledger.rounds else self.payload_bytes
+
+        idleIDs = np.flatnonzero(~self.busy)
+        np.random.shuffle(idleIDs)
+        for userID in idleIDs[:self.num_sampled]:
+            with profiler.phase("assign_resource"):
+                user_resource = assign_user_resource(self.config, userID, train_data, user_with_data)
+                updater = LocalUpdater(user_resource)
+            stash.grads = None
+            updater.local_step(model, stash)
+            if stash.grads is None:
+                continue
+
+            self.busy[userID] = True
+            self.in_flight += 1
+            self.loop.create_task(self._client(userID, stash.grads, self.version, downlinkBytes))
+
+        arrivals = self.loop.run_until_complete(self._collect())
+
+        # write the accepted gradients back and let the optimizer compress and gather them
+        accepted = 0
+        params = list(model.parameters())
+        for userID, grads, version in arrivals:
+            self.busy[userID] = False
+            staleness = self.version - version
+            if staleness > self.max_staleness:
+                self.dropped += 1
+                continue
+
+            for param, grad in zip(params, grads):
+                param.grad.copy_(grad)
+            optimizer.gather(turn=turn, userID=userID)
+            self.staleness.append(staleness)
+            accepted += 1
+
+        # the model stays put if every arrival was too stale
+        if accepted > 0:
+            with profiler.phase("step"):
+                optimizer.step()
+
+        roundTime = self.loop.time() - start
+        self.ledger.close_round(latency=roundTime)
+        if accepted > 0:
+            self.payload_bytes = self.ledger.rounds[-1]["uplink_bytes"].mean()
+        self.round_times.append(roundTime)
+        self.version += 1
+
+        return accepted
+
+    def summary(self, rounds):
+        """Summarize the last `rounds` rounds and the staleness of the updates aggregated so far."""
+        roundTimes = np.asarray(self.round_times[-rounds:])
+        staleness = np.asarray(self.staleness)
+        return dict(rounds_per_hour=3600 * roundTimes.shape[0] / max(roundTimes.sum(), 1e-12),
+                    mean_round_time=float(roundTimes.mean()),
+                    mean_staleness=float(staleness.mean()) if staleness.shape[0] > 0 else 0.,
+                    stale_updates=int(np.count_nonzero(staleness)),
+                    dropped_updates=self.dropped,
+                    in_flight=self.in_flight)
+
+    def close(self):
+        """Cancel the clients still in flight and close the loop."""
+        for task in asyncio.all_tasks(self.loop):
+            task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
@@ -0,0 +1,87 @@
+import os
+import random
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# PyTorch libraries
+import torch
+
+def _to_cpu(obj):
+    """Clone the tensors of a nested state to the cpu, so that training can go on while the copy is written."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    elif isinstance(obj, np.ndarray):
+        return obj.copy()
+    elif isinstance(obj, dict):
+        return {key: _to_cpu(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(value) for value in obj)
+    return obj
+
+def rng_state():
+    """Capture the states of the python, numpy and torch random generators."""
+    state = dict(python=random.getstate(),
+                 numpy=np.random.get_state(),
+                 torch=torch.get_rng_state())
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+def load_rng_state(state):
+    """Restore the random generators captured by `rng_state`."""
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+class CheckpointWriter(object):
+    def __init__(self, path):
+        """Write checkpoints in a background thread. A checkpoint is first written to a temporary
+        file and then renamed, so the file at `path` is always a complete checkpoint.
+
+        Args:
+            path (str):     the checkpoint file.
+        """
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def save(self, state):
+        """Snapshot the state on the caller thread and write it in the background.
+        At most one snapshot is in flight, a new one waits for the previous write.
+        """
+        snapshot = _to_cpu(state)
+        self.wait()
+        self._pending = self._executor.submit(self._write, snapshot)
+
+    def _write(self, snapshot):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "wb") as fp:
+            torch.save(snapshot, fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmpPath, self.path)
+
+    def wait(self):
+        """Block until the pending write is on disk."""
+        if self._pending is not None:
+            try:
+                self._pending.result()
+            except OSError as error:
+                logging.error("Checkpoint {:s} cannot be written: {:s}".format(self.path, str(error)))
+            self._pending = None
+
+    def close(self):
+        self.wait()
+        self._executor.shutdown()
+
+def load_checkpoint(path):
+    """Load a checkpoint written by `CheckpointWriter` to the cpu."""
+    with open(path, "rb") as fp:
+        return torch.load(fp, map_location="cpu", weights_only=False)
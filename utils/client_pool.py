@@ -0,0 +1,118 @@
+import multiprocessing as mp
+import numpy as np
+
+# PyTorch libraries
+import torch
+
+# My libraries
+from deeplearning.dataset import sample_resource
+from grace_fl.aggregation import edge_groups
+from grace_fl.gc_optimizer import LocalUpdater
+from utils.profiler import RoundProfiler
+
+# the state of a worker process, set once by `_init_worker`
+_worker = {}
+
+class _PayloadStash(object):
+    """Stand-in optimizer for LocalUpdater which keeps the codes of a user instead of gathering them."""
+    def __init__(self, optimizer):
+        self.optimizer = optimizer
+        self.profiler = RoundProfiler()
+        self.codes = []
+
+    def gather(self, **kwargs):
+        self.codes.append(self.optimizer.encode(**kwargs))
+
+def _share_tensors(obj):
+    """Move the tensors of a nested state to shared memory in place."""
+    if isinstance(obj, torch.Tensor):
+        obj.share_memory_()
+    elif isinstance(obj, dict):
+        for value in obj.values():
+            _share_tensors(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            _share_tensors(value)
+
+def _init_worker(config, model, optimizer, train_data, threads):
+    """Keep the inherited model, optimizer and dataset of a forked worker."""
+    torch.set_num_threads(threads)
+    optimizer.profiler = RoundProfiler()
+    optimizer.ledger = None
+    _worker.update(config=config, model=model, optimizer=optimizer, train_data=train_data)
+
+def _run_clients(task):
+    """Run the local steps of a slice of the cohort and compress the gradients.
+
+    Returns:
+        tuple:  the (userID, codes) payloads and the counters of the compressor accumulated in the slice.
+    """
+    turn, flags, clients = task
+    optimizer = _worker["optimizer"]
+    vars(optimizer).update(flags)
+    optimizer.grace.reset()
+
+    payloads = []
+    for userID, sampleIDs in clients:
+        updater = LocalUpdater(sample_resource(_worker["config"], sampleIDs, _worker["train_data"]))
+        stash = _PayloadStash(optimizer)
+        updater.local_step(_worker["model"], stash, turn=turn, userID=userID)
+        payloads.append((userID, stash.codes))
+
+    return payloads, optimizer.grace.counters()
+
+class ClientPool(object):
+    def __init__(self, config, model, optimizer, train_data, num_workers, threads=1):
+        """Run the local steps and the compression of the users in a persistent pool of worker processes.
+        The parameters of the model and the references of the optimizer are moved to shared memory, where
+        the server updates them in place, and the workers are forked so that they inherit the model, the
+        optimizer and the dataset. Each worker runs a contiguous slice of the cohort and returns the packed
+        payloads, which the server gathers in the order of the cohort. A user computes the same payload in
+        any worker, so the results do not depend on the number of workers.
+
+        Args:
+            config (class):                 a configuration class.
+            model (nn.Module):              the global model.
+            optimizer (torch.optim.Optimizer): the optimizer wrapped by `grace_optimizer`.
+            train_data (dict):              the training dataset, or a DeviceDataset on the cpu.
+            num_workers (int):              number of worker processes.
+            threads (int):                  torch threads of every worker.
+        """
+        for param in model.parameters():
+            param.data.share_memory_()
+        _share_tensors(optimizer.buffer_state_dict())
+
+        self.config = config
+        self.optimizer = optimizer
+        self.num_workers = num_workers
+        context = mp.get_context("fork")
+        self.pool = context.Pool(num_workers, initializer=_init_worker,
+                        initargs=(config, model, optimizer, train_data, threads))
+
+    def run_round(self, userIDs, user_with_data, turn):
+        """Draw the batches of the cohort, run the users on the workers and gather their payloads.
+
+        Returns:
+            int:  the number of gathered users.
+        """
+        # the server draws the batches, so the samplers advance as in a serial round
+        clients = [(userID, user_with_data.next_batch(userID, self.config.local_batch_size)) for userID in userIDs]
+        flags = {key: value for key, value in vars(self.optimizer).items() if isinstance(value, bool)}
+        slices = edge_groups(clients, int(np.ceil(len(clients) / self.num_workers)))
+
+        grace = self.optimizer.grace
+        numUsers = 0
+        for payloads, counters in self.pool.imap(_run_clients, [(turn, flags, clients) for clients in slices]):
+            for userID, userCodes in payloads:
+                for codes in userCodes:
+                    self.optimizer.receive(codes, turn=turn, userID=userID)
+            numUsers += len(payloads)
+
+            for key, value in counters.items():
+                setattr(grace, key, getattr(grace, key) + value)
+
+        return numUsers
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
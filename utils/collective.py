@@ -0,0 +1,77 @@
+import time
+import numpy as np
+
+# PyTorch libraries
+import torch
+import torch.distributed as dist
+
+# the types which gloo reduces, the narrower vote counts are widened for the collective
+_reduce_dtypes = (torch.uint8, torch.int8, torch.int32, torch.int64, torch.float32, torch.float64)
+
+class VoteCollective(object):
+    def __init__(self):
+        """Form the majority vote of users spread across the processes of a torch.distributed group.
+        Every process runs a contiguous slice of the cohort, and the votes meet in collectives over the
+        packed sign words of the users (all_gather) or over the integer vote counts (all_reduce), so the
+        server state stays identical in every process. The bytes of the tensors this process passes to
+        the collectives and the time spent in them are accounted per round.
+        """
+        self.rank = dist.get_rank()
+        self.world_size = dist.get_world_size()
+        self.rounds = []
+        self._bytes = 0
+        self._time = 0.
+
+    def owns(self, index, num_users):
+        """Whether the user at `index` of a cohort of num_users users runs in this process."""
+        return self.rank * num_users // self.world_size <= index < (self.rank + 1) * num_users // self.world_size
+
+    def all_reduce(self, counts):
+        """Sum the vote counts of every process in place."""
+        start = time.perf_counter()
+        reduced = counts if counts.dtype in _reduce_dtypes else counts.to(torch.int32)
+        dist.all_reduce(reduced)
+        if reduced is not counts:
+            counts.copy_(reduced)
+
+        self._time += time.perf_counter() - start
+        self._bytes += reduced.numel() * reduced.element_size()
+
+    def all_gather_codes(self, codes):
+        """Gather the packed sign codes of the users of every process in the order of the cohort.
+        The processes may hold different numbers of users, so the codes are padded to the largest slice.
+        """
+        start = time.perf_counter()
+        localCodes = torch.stack(codes)
+        sizes = [torch.zeros(1, dtype=torch.int64) for _ in range(self.world_size)]
+        dist.all_gather(sizes, torch.tensor([localCodes.shape[0]], dtype=torch.int64))
+
+        paddedCodes = localCodes.new_zeros((int(max(sizes)),) + localCodes.shape[1:])
+        paddedCodes[:localCodes.shape[0]] = localCodes
+        gatheredCodes = [torch.empty_like(paddedCodes) for _ in range(self.world_size)]
+        dist.all_gather(gatheredCodes, paddedCodes)
+
+        self._time += time.perf_counter() - start
+        self._bytes += paddedCodes.numel() * paddedCodes.element_size() + sizes[0].element_size()
+        return [code for size, rankCodes in zip(sizes, gatheredCodes) for code in rankCodes[:int(size)]]
+
+    def reduce_counters(self, grace):
+        """Sum the counters of the compressors of every process, e.g., before the compression ratio is read."""
+        counters = grace.counters()
+        values = torch.tensor([float(value) for value in counters.values()], dtype=torch.float64)
+        dist.all_reduce(values)
+        for (key, value), total in zip(counters.items(), values.tolist()):
+            setattr(grace, key, type(value)(total))
+
+    def close_round(self):
+        """Close the accounting of a round."""
+        self.rounds.append(dict(bytes=self._bytes, time=self._time))
+        self._bytes = 0
+        self._time = 0.
+
+    def summary(self, rounds):
+        """Mean bytes and time of the collectives per round over the last `rounds` rounds."""
+        rounds = self.rounds[-rounds:]
+        return dict(bytes_per_round=float(np.mean([entry["bytes"] for entry in rounds])),
+                    time_per_round=float(np.mean([entry["time"] for entry in rounds])),
+                    world_size=self.world_size)
@@ -0,0 +1,98 @@
+import numpy as np
+
+# My libraries
+import grace_fl.constant as const
+
+class CommLedger(object):
+    def __init__(self, num_users, uplink_mbps=10, downlink_mbps=50, latency_ms=50, sigma=0, seed=0):
+        """Account the uplink and downlink bytes of every client in every round and turn them into
+        a simulated round latency. Each client gets a fixed bandwidth and latency drawn from log-normal
+        distributions around the medians, and a round lasts as long as its slowest client.
+
+        Args:
+            num_users (int):        the number of users.
+            uplink_mbps (float):    median uplink bandwidth in Mbit/s.
+            downlink_mbps (float):  median downlink bandwidth in Mbit/s.
+            latency_ms (float):     median one-way latency in milliseconds.
+            sigma (float):          the standard deviation of the logarithms, 0 for identical clients.
+            seed (int):             the seed of the network simulation, independent of the training randomness.
+        """
+        rng = np.random.default_rng(seed)
+        self.uplink_bps = uplink_mbps * 1e6 * rng.lognormal(0, sigma, num_users)
+        self.downlink_bps = downlink_mbps * 1e6 * rng.lognormal(0, sigma, num_users)
+        self.latency = latency_ms * 1e-3 * rng.lognormal(0, sigma, num_users)
+
+        # per-user totals and the bytes of the round in progress
+        self.uplink_total = np.zeros(num_users, dtype=np.int64)
+        self.downlink_total = np.zeros(num_users, dtype=np.int64)
+        self._uplink = {}
+        self._downlink_bytes = 0
+        self._edge_bytes = []
+
+        # one entry per closed round
+        self.rounds = []
+        self.sim_time = 0.
+
+    def uplink(self, userID, nbits):
+        """Add the bits sent by a user in the current round."""
+        self._uplink[userID] = self._uplink.get(userID, 0) + -(-nbits // const.BYTE_BIT)
+
+    def downlink(self, nbits):
+        """Add the bits broadcast to every participant of the current round."""
+        self._downlink_bytes += -(-nbits // const.BYTE_BIT)
+
+    def edges(self, tierBits):
+        """Add the bits forwarded by each tier of edge aggregators in the current round."""
+        for tier, nbits in enumerate(tierBits):
+            if tier == len(self._edge_bytes):
+                self._edge_bytes.append(0)
+            self._edge_bytes[tier] += -(-nbits // const.BYTE_BIT)
+
+    def close_round(self, latency=None):
+        """Close the current round and return its simulated latency in seconds.
+        A client uploads its update and downloads the broadcast of the round.
+
+        Args:
+            latency (float):    if set, the latency measured by a scheduler instead of the slowest client.
+        """
+        userIDs = np.fromiter(self._uplink.keys(), dtype=np.int64)
+        uplinkBytes = np.fromiter(self._uplink.values(), dtype=np.int64)
+        downlinkBytes = self._downlink_bytes
+
+        clientTimes = (2*self.latency[userIDs]
+                       + downlinkBytes * const.BYTE_BIT / self.downlink_bps[userIDs]
+                       + uplinkBytes * const.BYTE_BIT / self.uplink_bps[userIDs])
+        if latency is None:
+            latency = float(clientTimes.max()) if clientTimes.shape[0] > 0 else 0.
+
+        self.uplink_total[userIDs] += uplinkBytes
+        self.downlink_total[userIDs] += downlinkBytes
+        self.sim_time += latency
+        self.rounds.append(dict(userIDs=userIDs, uplink_bytes=uplinkBytes, downlink_bytes=downlinkBytes, 
+                                edge_bytes=np.asarray(self._edge_bytes, dtype=np.int64), latency=latency))
+
+        self._uplink = {}
+        self._downlink_bytes = 0
+        self._edge_bytes = []
+        return latency
+
+    def summary(self, rounds):
+        """Summarize the given closed rounds, e.g., `ledger.rounds[-n:]`."""
+        uplinkBytes = sum(int(r["uplink_bytes"].sum()) for r in rounds)
+        downlinkBytes = sum(r["downlink_bytes"] * r["userIDs"].shape[0] for r in rounds)
+        numClients = sum(r["userIDs"].shape[0] for r in rounds)
+        latencies = np.asarray([r["latency"] for r in rounds])
+
+        # bytes forwarded by the edges of tier 1, 2, ... towards the server
+        edgeBytes = {}
+        for r in rounds:
+            for tier, nbytes in enumerate(r.get("edge_bytes", []), 1):
+                edgeBytes["tier{:d}".format(tier)] = edgeBytes.get("tier{:d}".format(tier), 0) + int(nbytes)
+
+        return dict(uplink_bytes=uplinkBytes,
+                    downlink_bytes=downlinkBytes,
+                    uplink_bytes_per_client=uplinkBytes / max(numClients, 1),
+                    mean_round_latency=float(latencies.mean()) if latencies.shape[0] > 0 else 0.,
+                    max_round_latency=float(latencies.max()) if latencies.shape[0] > 0 else 0.,
+                    edge_bytes=edgeBytes,
+                    sim_time=self.sim_time)
@@ -0,0 +1,92 @@
+import os
+import json
+import numpy as np
+
+def _flatten(entry, prefix=""):
+    """Flatten nested dicts into dotted keys."""
+    flat = {}
+    for key, value in entry.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, prefix + key + "."))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+def _to_json(value):
+    """Convert the numpy scalars and arrays which json cannot serialize."""
+    if isinstance(value, np.generic):
+        return value.item()
+    elif isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError("{:s} is not serializable.".format(str(type(value))))
+
+class MetricsWriter(object):
+    def __init__(self, path, flush_every=100):
+        """Append metrics to a line-delimited json file as they are produced. The lines are buffered
+        and written every `flush_every` entries, or when `flush` is called, e.g., at the end of an epoch.
+
+        Args:
+            path (str):         the metrics file, entries are appended if it exists.
+            flush_every (int):  number of buffered entries which triggers a write.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.flush_every = flush_every
+        self._fp = open(path, "a")
+        self._lines = []
+
+    def write(self, kind, **metrics):
+        """Buffer an entry of the given kind, e.g., "round" or "epoch"."""
+        entry = dict(kind=kind)
+        entry.update(_flatten(metrics))
+        self._lines.append(json.dumps(entry, default=_to_json))
+        if len(self._lines) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered entries to the file."""
+        if len(self._lines) > 0:
+            self._fp.write("\n".join(self._lines) + "\n")
+            self._lines = []
+        self._fp.flush()
+
+    def close(self):
+        self.flush()
+        self._fp.close()
+
+def load_metrics(path, key="turn"):
+    """
+    Load a metrics file into arrays for plotting.
+
+    Entries of a kind which share the same `key` (or "epoch" for epoch entries) are merged, the
+    later fields win, e.g., the entries logged again after a resume. A truncated line is ignored.
+
+    Returns:
+        dict:  {kind: {field: np.ndarray}}, missing fields are filled with nan.
+    """
+    entries = {}
+    with open(path, "r") as fp:
+        for line in fp:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            kind = entry.pop("kind")
+            kindEntries = entries.setdefault(kind, {})
+            index = entry.get("epoch" if kind == "epoch" else key, len(kindEntries))
+            kindEntries.setdefault(index, {}).update(entry)
+
+    metrics = {}
+    for kind, kindEntries in entries.items():
+        rows = [kindEntries[index] for index in sorted(kindEntries)]
+        fields = []
+        for row in rows:
+            for field in row:
+                if field not in fields:
+                    fields.append(field)
+        metrics[kind] = {field: np.asarray([row.get(field, np.nan) for row in rows]) for field in fields}
+
+    return metrics
@@ -0,0 +1,116 @@
+import time
+from contextlib import nullcontext
+
+# PyTorch libraries
+import torch
+from torch.profiler import profile, record_function, schedule, tensorboard_trace_handler, ProfilerActivity
+
+class _Phase(object):
+    """Context manager which adds its wall time to a named timer of the profiler."""
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.trace is not None:
+            self.record = record_function(self.name)
+            self.record.__enter__()
+        self.profiler._synchronize()
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.profiler._synchronize()
+        self.profiler.timers[self.name] = self.profiler.timers.get(self.name, 0.) + time.perf_counter() - self.start
+        self.profiler.count(self.name + "_calls")
+        if self.profiler.trace is not None:
+            self.record.__exit__(*args)
+
+class RoundProfiler(object):
+    def __init__(self, enabled=False, device="cpu", synchronize=False, trace_dir="", trace_rounds=5):
+        """Named wall-clock timers and counters for the phases of the training rounds.
+        A disabled profiler hands out a shared null context, so the hooks cost one call.
+
+        Args:
+            enabled (bool):         whether or not to time the phases.
+            device (str):           'cuda' or 'cpu', cuda kernels are awaited at the phase boundaries if synchronize is set.
+            synchronize (bool):     synchronize the device before reading the clock.
+            trace_dir (str):        if set, record a torch.profiler trace of trace_rounds rounds into the directory.
+            trace_rounds (int):     number of rounds recorded by the trace after one warmup round.
+        """
+        self.enabled = enabled
+        self.synchronize = synchronize and device == "cuda" and torch.cuda.is_available()
+        self.timers = {}
+        self.counters = {}
+        self._null = nullcontext()
+
+        self.trace = None
+        if enabled and trace_dir:
+            activities = [ProfilerActivity.CPU]
+            if device == "cuda" and torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            self.trace = profile(activities=activities,
+                                schedule=schedule(wait=0, warmup=1, active=trace_rounds, repeat=1),
+                                on_trace_ready=tensorboard_trace_handler(trace_dir),
+                                record_shapes=True)
+            self.trace.start()
+
+    def phase(self, name):
+        """Time the enclosed block under the given name."""
+        if not self.enabled:
+            return self._null
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        """Increment a named counter."""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def step(self):
+        """Mark the end of a round for the trace."""
+        if self.trace is not None:
+            self.trace.step()
+
+    def stop(self):
+        """Finish the trace if it is still recording."""
+        if self.trace is not None:
+            self.trace.stop()
+            self.trace = None
+
+    def summary(self):
+        """Return the timers, counters and throughput accumulated since the last reset.
+
+        The "round" timer is the wall time of the rounds, every other timer is also reported
+        as a fraction of it. Phases can be nested, so the fractions do not sum to 1.
+        """
+        summary = dict(self.timers)
+        summary.update(self.counters)
+
+        roundTime = self.timers.get("round", 0.)
+        if roundTime > 0:
+            for name, seconds in self.timers.items():
+                if name != "round":
+                    summary[name + "_fraction"] = seconds / roundTime
+            summary["rounds_per_sec"] = self.counters.get("rounds", 0) / roundTime
+            summary["clients_per_sec"] = self.counters.get("clients", 0) / roundTime
+
+        return summary
+
+    def log_summary(self, logger, summary):
+        """Write a summary to the logger, one line per phase."""
+        for name in sorted(self.timers):
+            line = "{:<16s} {:9.3f}s {:8d} calls".format(name, summary[name], summary.get(name + "_calls", 0))
+            if name + "_fraction" in summary:
+                line += " {:6.1%} of round".format(summary[name + "_fraction"])
+            logger.info(line)
+
+        if "rounds_per_sec" in summary:
+            logger.info("{:.3f} rounds/sec, {:.1f} clients/sec".format(summary["rounds_per_sec"], summary["clients_per_sec"]))
+
+    def reset(self):
+        """Reset the timers and counters."""
+        self.timers = {}
+        self.counters = {}
+
+    def _synchronize(self):
+        if self.synchronize:
+            torch.cuda.synchronize()
@@ -0,0 +1,26 @@
+def _format_cell(value, fmt):
+    """Format one value, floats keep 4 significant digits unless a format is given."""
+    if value is None:
+        return "-"
+    elif fmt is not None:
+        return fmt.format(value)
+    elif isinstance(value, float):
+        return "{:.4g}".format(value)
+    return str(value)
+
+def format_table(results, columns):
+    """Format the results as a text table with one right-aligned column per key.
+
+    Args:
+        results (list):     the rows, one dict per result, missing keys are printed as "-".
+        columns (list):     the keys of the columns, or (key, format) pairs.
+    """
+    columns = [column if isinstance(column, tuple) else (column, None) for column in columns]
+    rows = [[name for name, _ in columns]]
+    for result in results:
+        rows.append([_format_cell(result.get(name), fmt) for name, fmt in columns])
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    lines = ["  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows]
+    lines.insert(1, "-" * len(lines[0]))
+    return "\n".join(lines)
@@ -0,0 +1,159 @@
+import socket
+import struct
+
+# PyTorch libraries
+import torch
+
+# the prefix of a frame: payload bytes, number of tensors and an application tag, e.g., a userID
+_prefix = struct.Struct("<QII")
+# an entry of the tensor table: dtype code and number of bytes
+_entry = struct.Struct("<IQ")
+
+# tensors start at multiples of the widest element, so that the receiver views them in place
+_alignment = 8
+_padding = memoryview(bytes(_alignment))
+
+dtype_codes = {
+torch.uint8: 0,
+torch.int8: 1,
+torch.int16: 2,
+torch.int32: 3,
+torch.int64: 4,
+torch.float32: 5,
+torch.bool: 6
+}
+code_dtypes = {code: dtype for dtype, code in dtype_codes.items()}
+
+def _aligned(nbytes):
+    return -(-nbytes // _alignment) * _alignment
+
+def _storage_view(tensor):
+    """A byte memoryview of the storage of a contiguous cpu tensor, without copying it."""
+    return memoryview(tensor.detach().numpy()).cast("B")
+
+def send_frame(sock, tensors, tag=0):
+    """Send flat tensors, e.g., the outputs of a compressor, as one length-prefixed frame.
+    The frame is a gather list of the header and memoryviews of the tensor storages, so the
+    payloads are not copied into intermediate bytes objects.
+
+    Args:
+        sock (socket.socket):   a connected stream socket.
+        tensors (list):         contiguous cpu tensors.
+        tag (int):              an application tag delivered with the frame.
+
+    Returns:
+        int:  number of bytes of the frame.
+    """
+    table = []
+    buffers = [None]
+    payloadBytes = 0
+    for tensor in tensors:
+        view = _storage_view(tensor)
+        table.append(_entry.pack(dtype_codes[tensor.dtype], view.nbytes))
+        buffers.append(view)
+        padding = _aligned(view.nbytes) - view.nbytes
+        if padding > 0:
+            buffers.append(_padding[:padding])
+        payloadBytes += _aligned(view.nbytes)
+
+    buffers[0] = _prefix.pack(payloadBytes, len(tensors), tag) + b"".join(table)
+    frameBytes = len(buffers[0]) + payloadBytes
+    _send_buffers(sock, buffers)
+    return frameBytes
+
+def _send_buffers(sock, buffers):
+    """Send a gather list with sendmsg, resuming after partial sends."""
+    buffers = [memoryview(buffer) for buffer in buffers if len(buffer) > 0]
+    while len(buffers) > 0:
+        sent = sock.sendmsg(buffers)
+        while len(buffers) > 0 and sent >= buffers[0].nbytes:
+            sent -= buffers[0].nbytes
+            buffers.pop(0)
+        if sent > 0:
+            buffers[0] = buffers[0][sent:]
+
+def _recv_exact(sock, view):
+    """Fill a writable memoryview from the socket."""
+    received = 0
+    while received < view.nbytes:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("The connection is closed in the middle of a frame.")
+        received += count
+
+class FrameReceiver(object):
+    def __init__(self, sock, capacity=1<<20):
+        """Receive the frames of `send_frame` straight into a preallocated byte tensor. The tensors
+        returned by `recv` are views of that buffer and are overwritten by the next frame.
+
+        Args:
+            sock (socket.socket):   a connected stream socket.
+            capacity (int):         the initial bytes of the payload buffer, it grows to the largest frame.
+        """
+        self.sock = sock
+        self.buffer = torch.empty(_aligned(capacity), dtype=torch.uint8)
+        self._prefix = bytearray(_prefix.size)
+        self._table = bytearray(_entry.size * 16)
+
+    def recv(self):
+        """Receive a frame.
+
+        Returns:
+            tuple:  the tag and the list of tensors, or None if the peer closed the connection.
+        """
+        prefixView = memoryview(self._prefix)
+        count = self.sock.recv_into(prefixView)
+        if count == 0:
+            return None
+        _recv_exact(self.sock, prefixView[count:])
+        payloadBytes, numTensors, tag = _prefix.unpack(self._prefix)
+
+        tableBytes = numTensors * _entry.size
+        if tableBytes > len(self._table):
+            self._table = bytearray(tableBytes)
+        _recv_exact(self.sock, memoryview(self._table)[:tableBytes])
+
+        if payloadBytes > self.buffer.numel():
+            self.buffer = torch.empty(payloadBytes, dtype=torch.uint8)
+        _recv_exact(self.sock, _storage_view(self.buffer)[:payloadBytes])
+
+        tensors = []
+        offset = 0
+        for k in range(numTensors):
+            dtypeCode, nbytes = _entry.unpack_from(self._table, k * _entry.size)
+            tensors.append(self.buffer[offset:offset+nbytes].view(code_dtypes[dtypeCode]))
+            offset += _aligned(nbytes)
+
+        return tag, tensors
+
+def connect(address):
+    """Connect to a transport server, a (host, port) pair for TCP or a path for a Unix socket."""
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.connect(address)
+    return sock
+
+def accept(listener):
+    """Accept a connection of a listening socket."""
+    sock, _ = listener.accept()
+    if sock.family != socket.AF_UNIX:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def listen(address):
+    """Listen on a (host, port) pair for TCP, port 0 picks a free port, or on a Unix socket path.
+
+    Returns:
+        tuple:  the listening socket and its address.
+    """
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(1)
+    return sock, sock.getsockname()